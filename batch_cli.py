@@ -0,0 +1,315 @@
+"""Headless batch runner for fruit detection and banana ripeness grading.
+
+Example:
+    python batch_cli.py photos/ "belt/*.jpg" @list.txt --workers 8 --annotate-dir out/
+    python batch_cli.py photos/ --metrics-out metrics --trace-out slowest.json
+    python batch_cli.py photos/ --thumbnails --prefetch 4
+    python batch_cli.py photos/ --mode both --store results.db   # only new or changed images
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+
+from smartfruit import profiles, profiling
+from smartfruit.frame_analysis import FrameAnalysis
+from smartfruit.image_processor import get_label_lut
+from smartfruit.image_loader import IMAGE_EXTENSIONS, ThumbnailCache, prefetch_iter, read_image
+from smartfruit.fruit_detector import (detect_fruit_blobs, detections_to_json, draw_fruits,
+                            find_banana_ripeness, draw_banana_ripeness)
+from smartfruit import fruit_detector
+
+# Store commits after this many images, so an interrupted run keeps its progress
+STORE_COMMIT_EVERY = 200
+
+def collect_image_paths(inputs, recursive=False):
+    """Expand directories, glob patterns and @file lists into a list of image paths."""
+    paths = []
+    for item in inputs:
+        if item.startswith("@"):
+            # File list: one path per line, blank lines and #comments ignored
+            with open(item[1:], encoding="utf-8") as f:
+                paths.extend(line.strip() for line in f
+                             if line.strip() and not line.startswith("#"))
+        elif os.path.isdir(item):
+            pattern = os.path.join(item, "**", "*") if recursive else os.path.join(item, "*")
+            paths.extend(p for p in sorted(glob.glob(pattern, recursive=recursive))
+                         if p.lower().endswith(IMAGE_EXTENSIONS))
+        elif glob.has_magic(item):
+            paths.extend(sorted(glob.glob(item, recursive=recursive)))
+        else:
+            paths.append(item)
+    return paths
+
+# Per-worker settings, filled in by _init_worker() in every pool process
+_worker_options = {}
+_thumbnails = None
+
+def _init_worker(options):
+    """Pool initializer: store options and keep OpenCV from oversubscribing the CPU."""
+    global _thumbnails
+    _worker_options.update(options)
+    cv2.setNumThreads(1)
+    if options.get("profile"):
+        profiling.enable()
+    if options.get("thumbnails"):
+        _thumbnails = ThumbnailCache(options.get("cache_dir"))
+    # Forked workers inherit the registered profiles, and with them the parent's lookup
+    # table; registering them again would make that table stale
+    if options.get("profiles") and multiprocessing.get_start_method() != "fork":
+        profiles.load_profiles(options["profiles"])
+
+def load_image(path):
+    """Decode one image for process_image(); runs on the prefetch thread.
+
+    Returns (image or None, error message or None, seconds spent).
+    """
+    start = time.perf_counter()
+    try:
+        img = _thumbnails.get(path) if _thumbnails is not None else read_image(path)
+        error = None if img is not None else "could not read image"
+    except OSError as e:
+        img, error = None, str(e)
+    return img, error, time.perf_counter() - start
+
+def process_image(path, loaded=None, wait_seconds=0.0):
+    """Run the configured detectors on one image.
+
+    loaded is the load_image() result for path, the image is read here if it
+    is None. wait_seconds is the time spent waiting for a prefetched loaded.
+    Returns (record, pid, busy seconds, trace); busy seconds count the decode
+    only when it ran here, and trace holds the stage timings of the image when
+    profiling is enabled and is merged with profiling.add_trace().
+    """
+    if loaded is None:
+        loaded = load_image(path)
+        wait_seconds = loaded[2]
+    img, error, load_seconds = loaded
+    start = time.perf_counter()
+    record = {"path": path}
+    with profiling.frame(path, record=False) as trace:
+        profiling.record("thumbnail" if _thumbnails is not None else "decode", load_seconds)
+        _process_image(path, img, error, record)
+    seconds = time.perf_counter() - start
+    record["elapsed_ms"] = round((seconds + load_seconds) * 1000.0, 3)
+    return record, os.getpid(), seconds + wait_seconds, trace
+
+def _iter_chunk(paths):
+    depth = _worker_options.get("prefetch", 2)
+    if not depth:
+        for path in paths:
+            yield process_image(path)
+        return
+    # The decode overlaps with the previous image; only waiting for it keeps the worker busy
+    images = prefetch_iter(paths, load_image, depth)
+    while True:
+        start = time.perf_counter()
+        item = next(images, None)
+        if item is None:
+            break
+        path, loaded = item
+        yield process_image(path, loaded, time.perf_counter() - start)
+
+def process_chunk(paths):
+    """process_image() over a list of paths, decoding the next few in the background."""
+    return list(_iter_chunk(paths))
+
+def _process_image(path, img, error, record):
+    try:
+        if img is None:
+            raise ValueError(error)
+        record["height"], record["width"] = img.shape[:2]
+
+        # Each image is seen once, so share intermediates between detectors without the frame cache
+        frame = FrameAnalysis(img)
+        mode = _worker_options.get("mode", "fruits")
+        # Ripeness first, so fruit detection reuses its banana components instead of labelling again
+        bananas = find_banana_ripeness(frame) if mode in ("ripeness", "both") else None
+        fruits = None
+        if mode in ("fruits", "both"):
+            target_fruit = _worker_options.get("fruit", "All Fruits")
+            pyramid_level = _worker_options.get("pyramid_level")
+            if pyramid_level:
+                # Imported here so that workers without --pyramid never load it
+                from smartfruit.pyramid import detect_pyramid
+                fruits = detect_pyramid(img, target_fruit, level=pyramid_level)
+            else:
+                fruits = detect_fruit_blobs(frame, target_fruit)
+        record.update(detections_to_json(fruits, bananas))
+
+        annotate_dir = _worker_options.get("annotate_dir")
+        if annotate_dir:
+            # Draw in place on the decoded image, it is not needed afterwards
+            if fruits is not None:
+                draw_fruits(img, fruits)
+            if bananas is not None:
+                draw_banana_ripeness(img, bananas)
+            out_path = os.path.join(annotate_dir, os.path.basename(path))
+            if not cv2.imwrite(out_path, img):
+                raise ValueError(f"could not write annotated image to {out_path}")
+    except Exception as e:
+        record["error"] = str(e)
+
+def run_batch(paths, options, workers=None, chunksize=None, ordered=True):
+    """Fan paths out over a process pool and yield process_image() results.
+
+    Every worker decodes the next images of its chunk in the background while
+    it analyses the current one. With ordered=False results are yielded as
+    soon as their chunk finishes.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(options)
+        yield from _iter_chunk(paths)
+        return
+    if chunksize is None:
+        # A few chunks per worker keeps the pool balanced without per-image IPC overhead
+        chunksize = max(1, len(paths) // (workers * 4))
+    chunks = [paths[i:i + chunksize] for i in range(0, len(paths), chunksize)]
+    if multiprocessing.get_start_method() == "fork":
+        # Build the lookup table once here, forked workers then inherit it
+        get_label_lut()
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(options,)) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for results in imap(process_chunk, chunks):
+            yield from results
+
+def pipeline_params(options):
+    """Everything that changes the detections of an image, for the result store manifest."""
+    return {
+        "mode": options["mode"],
+        "fruit": options["fruit"],
+        "pyramid_level": options["pyramid_level"],
+        "thumbnails": bool(options["thumbnails"]),
+        "hsv_ranges": profiles.FRUIT_HSV_RANGES,
+        "min_area": [fruit_detector.FRUIT_MIN_AREA, fruit_detector.BANANA_MIN_AREA],
+        "ripeness": [fruit_detector.RIPENESS_GREEN_MIN_HUE, fruit_detector.RIPENESS_BROWN_VALUE_RATIO,
+                     fruit_detector.RIPENESS_PEEL_PERCENTILE, fruit_detector.RIPENESS_EDGE_MARGIN,
+                     fruit_detector.RIPENESS_YELLOW_THRESHOLDS, fruit_detector.RIPENESS_BROWN_THRESHOLDS],
+    }
+
+def format_summary(n_images, n_failed, wall_seconds, worker_busy):
+    """Build the throughput summary printed at the end of a run."""
+    lines = [f"Processed {n_images} images ({n_failed} failed) in {wall_seconds:.2f}s "
+             f"-> {n_images / wall_seconds if wall_seconds > 0 else 0.0:.2f} images/s"]
+    for pid, (count, busy) in sorted(worker_busy.items()):
+        utilisation = busy / wall_seconds * 100.0 if wall_seconds > 0 else 0.0
+        lines.append(f"  worker {pid}: {count} images, busy {busy:.2f}s ({utilisation:.1f}% utilisation)")
+    return "\n".join(lines)
+
+def format_stage_summary(snapshot):
+    """Build the per-stage timing table printed with --profile."""
+    lines = ["Stage timings:"]
+    for name, s in sorted(snapshot["stages"].items(), key=lambda item: -item[1]["sum_seconds"]):
+        lines.append(f"  {name:<20} {s['count']:7d} calls  total {s['sum_seconds']:8.3f}s  "
+                     f"mean {s['mean_ms']:8.3f} ms  max {s['max_ms']:8.3f} ms")
+    for c in snapshot["counters"]:
+        labels = ",".join(f"{k}={v}" for k, v in c["labels"].items())
+        lines.append(f"  {c['name']}{{{labels}}} {c['value']}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detect fruits and grade banana ripeness on many images.")
+    parser.add_argument("inputs", nargs="+", help="Image files, directories, glob patterns or @filelist.txt")
+    parser.add_argument("--mode", choices=["fruits", "ripeness", "both"], default="fruits")
+    parser.add_argument("--fruit", default="All Fruits",
+                        help="Fruit type for --mode fruits/both: All Fruits or a fruit profile name")
+    parser.add_argument("--profiles", metavar="JSON",
+                        help="Register extra fruit colour profiles from this file (see smartfruit.profiles)")
+    parser.add_argument("--pyramid", type=int, default=0, metavar="LEVEL",
+                        help="Find fruit candidates at 1/2**LEVEL scale first (2 or 3), refine at full resolution")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Recurse into directories")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunksize", type=int, default=None, help="Images per task submitted to a worker")
+    parser.add_argument("--unordered", action="store_true", help="Emit results as soon as they finish")
+    parser.add_argument("--annotate-dir", default=None, help="Write annotated images to this directory")
+    parser.add_argument("--prefetch", type=int, default=2, metavar="K",
+                        help="Images each worker decodes ahead in the background (0 disables, default 2)")
+    parser.add_argument("--thumbnails", action="store_true",
+                        help="Analyse contrast-enhanced 800x600 thumbnails, decoded at reduced resolution "
+                             "and cached on disk")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Thumbnail cache directory (default: $SMARTFRUIT_CACHE_DIR or ~/.cache/smartfruit)")
+    parser.add_argument("-o", "--output", default="-", help="JSON lines output file (default: stdout)")
+    parser.add_argument("--store", metavar="DB",
+                        help="Also save results to this SQLite file and skip images already stored "
+                             "with unchanged content and parameters")
+    parser.add_argument("--force", action="store_true", help="With --store, reprocess every image")
+    parser.add_argument("--profile", action="store_true", help="Print per-stage timings at the end")
+    parser.add_argument("--metrics-out", metavar="PREFIX",
+                        help="Write stage metrics to PREFIX.prom (Prometheus) and PREFIX.json")
+    parser.add_argument("--trace-out", help="Write stage traces of the slowest images to this JSON file")
+    parser.add_argument("--trace-slowest", type=int, default=10, metavar="N",
+                        help="Number of slowest images kept for --trace-out (default 10)")
+    args = parser.parse_args(argv)
+
+    if args.profiles:
+        profiles.load_profiles(args.profiles)
+    if args.fruit != "All Fruits" and args.fruit.lower() not in profiles.FRUIT_TYPES:
+        parser.error(f"unknown fruit {args.fruit!r}, expected All Fruits or one of {', '.join(profiles.FRUIT_TYPES)}")
+
+    paths = collect_image_paths(args.inputs, args.recursive)
+    if not paths:
+        parser.error("no input images found")
+    if args.annotate_dir:
+        os.makedirs(args.annotate_dir, exist_ok=True)
+
+    profile = args.profile or args.metrics_out or args.trace_out
+    if profile:
+        profiling.enable(args.trace_slowest)
+
+    options = {"mode": args.mode, "fruit": args.fruit, "annotate_dir": args.annotate_dir,
+               "pyramid_level": args.pyramid, "profile": bool(profile), "prefetch": args.prefetch,
+               "thumbnails": args.thumbnails, "cache_dir": args.cache_dir, "profiles": args.profiles}
+    store = params_key = None
+    if args.store:
+        from smartfruit.result_store import ResultStore
+        store = ResultStore(args.store)
+        params_key = store.register_params(pipeline_params(options))
+        if not args.force:
+            n_paths = len(paths)
+            paths = store.pending(paths, params_key)
+            print(f"Skipping {n_paths - len(paths)} unchanged images already in {args.store}", file=sys.stderr)
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    worker_busy = {}
+    n_images = n_failed = 0
+    start = time.perf_counter()
+    try:
+        for record, pid, busy, trace in run_batch(paths, options, args.workers, args.chunksize,
+                                                  not args.unordered):
+            profiling.add_trace(trace)
+            out.write(json.dumps(record) + "\n")
+            n_images += 1
+            if store is not None:
+                store.add(record, params_key)
+                if n_images % STORE_COMMIT_EVERY == 0:
+                    store.commit()
+            n_failed += "error" in record
+            count, total = worker_busy.get(pid, (0, 0.0))
+            worker_busy[pid] = (count + 1, total + busy)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if store is not None:
+            store.commit()
+            store.close()
+    print(format_summary(n_images, n_failed, time.perf_counter() - start, worker_busy), file=sys.stderr)
+
+    if args.profile:
+        print(format_stage_summary(profiling.snapshot()), file=sys.stderr)
+    if args.metrics_out:
+        with open(args.metrics_out + ".prom", "w", encoding="utf-8") as f:
+            f.write(profiling.export_prometheus())
+        with open(args.metrics_out + ".json", "w", encoding="utf-8") as f:
+            f.write(profiling.snapshot_json())
+    if args.trace_out:
+        profiling.dump_traces(args.trace_out)
+    return 1 if n_failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
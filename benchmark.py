@@ -0,0 +1,297 @@
+"""Speed and accuracy benchmark of the processing pipeline on synthetic scenes.
+
+Example:
+    python benchmark.py --resolutions vga,fullhd,4k --save-baseline bench_baseline.json
+    python benchmark.py --resolutions vga,fullhd,4k --baseline bench_baseline.json
+
+The second run exits with status 1 if any stage got slower or less accurate
+than the baseline by more than the tolerances.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from smartfruit.image_processor import label_fruits, preprocess_image, segment_fruits
+from smartfruit.frame_analysis import FrameAnalysis
+from smartfruit.fruit_detector import (FRUIT_TYPES, BANANA_MIN_AREA, color_based_detection, detect_banana_ripeness,
+                            detect_fruit_blobs, detect_label_blobs, find_banana_ripeness)
+from smartfruit.pyramid import detect_pyramid
+from stream import IncrementalDetector
+from synthetic_scene import RESOLUTIONS, generate_clip, generate_scene
+
+# Benchmarked stages. Detectors get a fresh FrameAnalysis so the frame cache
+# never turns repeated runs into cache hits.
+STAGES = {
+    "preprocess_image": preprocess_image,
+    "segment_fruits": segment_fruits,
+    "color_based_detection": lambda img: color_based_detection(FrameAnalysis(img)),
+    "detect_banana_ripeness": lambda img: detect_banana_ripeness(FrameAnalysis(img)),
+    "detect_pyramid": detect_pyramid,
+}
+
+# Detections scored against the ground truth, per detector stage
+ACCURACY_STAGES = {
+    "color_based_detection": (lambda img: detect_fruit_blobs(FrameAnalysis(img)), FRUIT_TYPES),
+    "detect_banana_ripeness": (lambda img: detect_fruit_blobs(FrameAnalysis(img), "Banana", BANANA_MIN_AREA),
+                               ("banana",)),
+    "detect_pyramid": (detect_pyramid, FRUIT_TYPES),
+}
+
+# Degradations of the synthetic bananas, which have no spots, that must not
+# make them read as spotted (ripeness level 5+)
+RIPENESS_DEGRADATIONS = {
+    "blur": lambda img: cv2.GaussianBlur(img, (5, 5), 0),
+    "jpeg": lambda img: cv2.imdecode(cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 85])[1],
+                                     cv2.IMREAD_COLOR),
+}
+
+def spotless_ripeness_check(img):
+    """Grade the spotless bananas of a synthetic scene after every RIPENESS_DEGRADATIONS entry.
+
+    Returns {"bananas": bananas graded, "spotted": bananas graded level 5+}; spotted should be 0.
+    """
+    graded = spotted = 0
+    for degrade in RIPENESS_DEGRADATIONS.values():
+        levels = [banana["level"] for banana in find_banana_ripeness(FrameAnalysis(degrade(img)))]
+        graded += len(levels)
+        spotted += sum(level >= 5 for level in levels)
+    return {"bananas": graded, "spotted": spotted}
+
+def stream_consistency_check(width, height, seed=0):
+    """Compare stream.IncrementalDetector with full-frame detection on a moving-fruit clip.
+
+    The clip is two rows shorter than height, so that the last rows do not fill
+    a whole thumbnail block. Returns {"frames", "mismatched": frames whose
+    detections differ, "stale_pixels": most label pixels that differ in a frame};
+    mismatched should be 0.
+    """
+    detector = IncrementalDetector()
+    frames = mismatched = stale = 0
+    for frame in generate_clip(width, height - 2, seed=seed):
+        detections, _ = detector.update(frame)
+        labels = label_fruits(frame)
+        expected = detect_label_blobs(labels)
+        frames += 1
+        mismatched += not (len(detections) == len(expected)
+                           and np.array_equal(detections[['fruit', 'bbox', 'area']], expected[['fruit', 'bbox', 'area']]))
+        stale = max(stale, int(np.count_nonzero(detector.labels != labels)))
+    return {"frames": frames, "mismatched": mismatched, "stale_pixels": stale}
+
+def box_iou(boxes_a, boxes_b):
+    """IoU matrix between two (N, 4) and (M, 4) arrays of (x, y, w, h) boxes."""
+    a = np.asarray(boxes_a, np.float64).reshape(-1, 1, 4)
+    b = np.asarray(boxes_b, np.float64).reshape(1, -1, 4)
+    iw = np.clip(np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    ih = np.clip(np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = iw * ih
+    union = a[..., 2] * a[..., 3] + b[..., 2] * b[..., 3] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+def match_detections(detections, truth, fruits, iou_threshold=0.5):
+    """Greedily match detections to ground truth of the same fruit by IoU.
+
+    Returns (true positives, false positives, false negatives).
+    """
+    tp = fp = fn = 0
+    for fruit_id, fruit in enumerate(FRUIT_TYPES):
+        if fruit not in fruits:
+            continue
+        found = detections['bbox'][detections['fruit'] == fruit_id]
+        expected = [t["bbox"] for t in truth if t["fruit"] == fruit]
+        matched = 0
+        if len(found) and expected:
+            iou = box_iou(found, expected)
+            # Take the best remaining pair until no pair passes the threshold
+            while True:
+                i, j = np.unravel_index(np.argmax(iou), iou.shape)
+                if iou[i, j] < iou_threshold:
+                    break
+                matched += 1
+                iou[i, :] = 0
+                iou[:, j] = 0
+        tp += matched
+        fp += len(found) - matched
+        fn += len(expected) - matched
+    return tp, fp, fn
+
+def time_stage(fn, img, repeat, warmup):
+    """Run fn(img) and return per-run latencies in milliseconds and the traced peak memory in MB."""
+    for _ in range(warmup):
+        fn(img)
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(img)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+
+    # Separate run for memory, tracemalloc slows allocations down
+    tracemalloc.start()
+    fn(img)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return latencies, peak / 1e6
+
+def run_benchmark(resolutions, repeat=10, warmup=2, seed=0, stages=None):
+    """Benchmark every stage at every resolution and return a JSON-ready report."""
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "results": {},
+    }
+    for name in resolutions:
+        width, height = RESOLUTIONS[name]
+        img, truth = generate_scene(width, height, seed=seed)
+        result = {"width": width, "height": height, "fruits": len(truth), "stages": {}, "accuracy": {}}
+
+        for stage in stages or STAGES:
+            latencies, peak_mb = time_stage(STAGES[stage], img, repeat, warmup)
+            mean = float(np.mean(latencies))
+            result["stages"][stage] = {
+                "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                "p90_ms": round(float(np.percentile(latencies, 90)), 3),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+                "mean_ms": round(mean, 3),
+                "images_per_s": round(1000.0 / mean, 2),
+                "megapixels_per_s": round(width * height / 1e3 / mean, 2),
+                "peak_mem_mb": round(peak_mb, 2),
+            }
+
+        for stage, (detect, fruits) in ACCURACY_STAGES.items():
+            if stage not in result["stages"]:
+                continue
+            tp, fp, fn = match_detections(detect(img), truth, fruits)
+            result["accuracy"][stage] = {
+                "precision": round(tp / (tp + fp), 4) if tp + fp else 1.0,
+                "recall": round(tp / (tp + fn), 4) if tp + fn else 1.0,
+                "tp": tp, "fp": fp, "fn": fn,
+            }
+        if "detect_banana_ripeness" in result["stages"]:
+            result["ripeness"] = spotless_ripeness_check(img)
+        result["stream"] = stream_consistency_check(width, height, seed)
+        report["results"][name] = result
+
+    # ru_maxrss is in kilobytes on Linux
+    report["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+    return report
+
+def compare_to_baseline(report, baseline, latency_tolerance=0.25, accuracy_tolerance=0.01):
+    """Return a list of regression messages of report relative to baseline."""
+    regressions = []
+    for name, result in report["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        for stage, stats in result["stages"].items():
+            base_stats = base["stages"].get(stage)
+            if base_stats and stats["p50_ms"] > base_stats["p50_ms"] * (1.0 + latency_tolerance):
+                regressions.append(f"{name}/{stage}: p50 {stats['p50_ms']:.2f} ms vs baseline "
+                                   f"{base_stats['p50_ms']:.2f} ms (+{latency_tolerance:.0%} allowed)")
+        for stage, scores in result["accuracy"].items():
+            base_scores = base.get("accuracy", {}).get(stage)
+            if not base_scores:
+                continue
+            for metric in ("precision", "recall"):
+                if scores[metric] < base_scores[metric] - accuracy_tolerance:
+                    regressions.append(f"{name}/{stage}: {metric} {scores[metric]:.4f} vs baseline "
+                                       f"{base_scores[metric]:.4f}")
+    return regressions
+
+def format_report(report):
+    lines = []
+    for name, result in report["results"].items():
+        lines.append(f"{name} ({result['width']}x{result['height']}, {result['fruits']} fruits)")
+        for stage, s in result["stages"].items():
+            lines.append(f"  {stage:<24} p50 {s['p50_ms']:9.2f} ms  p90 {s['p90_ms']:9.2f} ms  "
+                         f"p99 {s['p99_ms']:9.2f} ms  {s['images_per_s']:8.2f} img/s  "
+                         f"{s['megapixels_per_s']:8.2f} MP/s  peak {s['peak_mem_mb']:8.2f} MB")
+        for stage, a in result["accuracy"].items():
+            lines.append(f"  {stage:<24} precision {a['precision']:.3f}  recall {a['recall']:.3f}  "
+                         f"(tp {a['tp']}, fp {a['fp']}, fn {a['fn']})")
+        if "ripeness" in result:
+            r = result["ripeness"]
+            lines.append(f"  {'ripeness (spotless)':<24} {r['spotted']} of {r['bananas']} blurred/JPEG bananas "
+                         f"graded as spotted")
+        if "stream" in result:
+            r = result["stream"]
+            lines.append(f"  {'stream (moving fruits)':<24} {r['mismatched']} of {r['frames']} frames differ from "
+                         f"full detection, up to {r['stale_pixels']} stale label pixels")
+    lines.append(f"max RSS {report['max_rss_mb']} MB")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the fruit pipeline on synthetic scenes.")
+    parser.add_argument("--resolutions", default="vga,hd,fullhd,4k",
+                        help=f"Comma-separated list of {', '.join(RESOLUTIONS)}")
+    parser.add_argument("--stages", default=",".join(STAGES), help="Comma-separated stages to run")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write the JSON report to this file")
+    parser.add_argument("--save-baseline", help="Write the JSON report as a new baseline")
+    parser.add_argument("--baseline", help="Compare against this baseline and fail on regressions")
+    parser.add_argument("--latency-tolerance", type=float, default=0.25,
+                        help="Allowed relative p50 slowdown (default 0.25)")
+    parser.add_argument("--accuracy-tolerance", type=float, default=0.01,
+                        help="Allowed absolute precision/recall drop (default 0.01)")
+    args = parser.parse_args(argv)
+
+    resolutions = [r.strip() for r in args.resolutions.split(",") if r.strip()]
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    for name in resolutions:
+        if name not in RESOLUTIONS:
+            parser.error(f"unknown resolution {name!r}")
+    for stage in stages:
+        if stage not in STAGES:
+            parser.error(f"unknown stage {stage!r}")
+
+    report = run_benchmark(resolutions, args.repeat, args.warmup, args.seed, stages)
+    print(format_report(report))
+    failed = 0
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+
+    # Spotless bananas graded as spotted are wrong whatever the baseline says
+    spotted = [name for name, result in report["results"].items() if result.get("ripeness", {}).get("spotted")]
+    if spotted:
+        print(f"\nFAILED: spotless bananas graded as spotted at {', '.join(spotted)}", file=sys.stderr)
+        failed = 1
+
+    # Incremental stream detection must match full detection on the clip
+    stale = [name for name, result in report["results"].items() if result.get("stream", {}).get("mismatched")]
+    if stale:
+        print(f"\nFAILED: incremental stream detection differs from full detection at {', '.join(stale)}",
+              file=sys.stderr)
+        failed = 1
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(report, baseline, args.latency_tolerance, args.accuracy_tolerance)
+        if regressions:
+            print(f"\nREGRESSION: {len(regressions)} check(s) failed against {args.baseline}", file=sys.stderr)
+            for message in regressions:
+                print(f"  {message}", file=sys.stderr)
+            return 1
+        print(f"\nNo regressions against {args.baseline}")
+    return failed
+
+if __name__ == "__main__":
+    sys.exit(main())
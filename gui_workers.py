@@ -0,0 +1,130 @@
+from collections import OrderedDict
+
+import cv2
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, Qt, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
+
+class _TaskSignals(QObject):
+    # Emitted from the worker thread, delivered to the GUI thread through a queued connection.
+    # Arguments: channel, request id, whether fn raised, result or error message.
+    done = pyqtSignal(str, int, bool, object)
+
+class _Task(QRunnable):
+    """Runs fn(*args) on a QThreadPool thread unless it was superseded before starting."""
+
+    def __init__(self, channel, request_id, fn, args, is_current):
+        super().__init__()
+        self.setAutoDelete(False) # TaskRunner owns the task until its done signal arrives
+        self.channel = channel
+        self.request_id = request_id
+        self.fn = fn
+        self.args = args
+        self.is_current = is_current
+        self.signals = _TaskSignals()
+
+    def run(self):
+        failed, result = False, None
+        if self.is_current(self.channel, self.request_id):
+            try:
+                result = self.fn(*self.args)
+            except Exception as e:
+                failed, result = True, str(e)
+        self.signals.done.emit(self.channel, self.request_id, failed, result)
+
+class TaskRunner(QObject):
+    """Runs image processing off the Qt main thread and delivers results via signals.
+
+    Requests are grouped in channels (e.g. "load" and "process"). A new request
+    supersedes older ones on the same channel: queued ones never start and
+    results of running ones are dropped, so only the latest result is shown.
+    """
+    busy_changed = pyqtSignal(bool)
+    failed = pyqtSignal(str)
+
+    def __init__(self, parent=None, max_threads=2):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self._latest = {}
+        self._pending = {} # channel -> (request_id, on_result)
+        self._tasks = {} # (channel, request_id) -> task, kept alive until done
+
+    def _is_current(self, channel, request_id):
+        return self._latest.get(channel) == request_id
+
+    def submit(self, channel, fn, args, on_result):
+        """Run fn(*args) in the pool and call on_result(result) in the GUI thread."""
+        request_id = self._latest.get(channel, 0) + 1
+        self._latest[channel] = request_id
+        task = _Task(channel, request_id, fn, args, self._is_current)
+        task.signals.done.connect(self._on_done)
+        self._tasks[(channel, request_id)] = task
+        self._pending[channel] = (request_id, on_result)
+        self.pool.start(task)
+        self.busy_changed.emit(True)
+        return request_id
+
+    def cancel(self, channel):
+        """Drop the pending request of a channel, if any."""
+        self._latest[channel] = self._latest.get(channel, 0) + 1
+        if self._pending.pop(channel, None) is not None and not self._pending:
+            self.busy_changed.emit(False)
+
+    def _on_done(self, channel, request_id, failed, result):
+        self._tasks.pop((channel, request_id), None)
+        pending = self._pending.get(channel)
+        if pending is None or pending[0] != request_id:
+            return # Superseded or cancelled
+        del self._pending[channel]
+        if not self._pending:
+            self.busy_changed.emit(False)
+        if failed:
+            self.failed.emit(result)
+        else:
+            pending[1](result)
+
+class PixmapCache:
+    """Caches the RGB conversion of OpenCV images and their scaled pixmaps per label size.
+
+    Entries are keyed by image identity, so images must not be modified in place
+    after they have been displayed.
+    """
+
+    def __init__(self, max_images=8):
+        self.max_images = max_images
+        self._entries = OrderedDict()
+
+    def get(self, cv_img, size):
+        """Return a QPixmap of cv_img scaled to fit size, keeping the aspect ratio."""
+        key = id(cv_img)
+        entry = self._entries.get(key)
+        if entry is None or entry['img'] is not cv_img:
+            entry = self._entries[key] = {'img': cv_img, 'pixmap': self._to_pixmap(cv_img), 'scaled': {}}
+            while len(self._entries) > self.max_images:
+                self._entries.popitem(last=False)
+        self._entries.move_to_end(key)
+
+        size_key = (size.width(), size.height())
+        scaled = entry['scaled'].get(size_key)
+        if scaled is None:
+            scaled = entry['scaled'][size_key] = entry['pixmap'].scaled(
+                size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        return scaled
+
+    @staticmethod
+    def _to_pixmap(cv_img):
+        # Convert to RGB for QImage
+        # Handle potential single channel images (like Canny edges output)
+        if len(cv_img.shape) == 2 or cv_img.shape[2] == 1: # Grayscale or single channel
+            img_rgb = cv2.cvtColor(cv_img, cv2.COLOR_GRAY2RGB)
+        else:
+            img_rgb = cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB)
+
+        h, w, ch = img_rgb.shape
+        bytes_per_line = ch * w
+        q_img = QImage(img_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
+        # fromImage copies the pixels, so img_rgb may be freed afterwards
+        return QPixmap.fromImage(q_img)
+
+    def clear(self):
+        self._entries.clear()
@@ -1,15 +1,21 @@
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QLabel, QVBoxLayout, QHBoxLayout,
-                             QWidget, QPushButton, QFileDialog, QGroupBox, QComboBox)
-from PyQt5.QtGui import QImage, QPixmap, QFont
+                             QWidget, QPushButton, QFileDialog, QGroupBox, QComboBox, QProgressBar)
+from PyQt5.QtGui import QFont
 from PyQt5.QtCore import Qt, QSize # Import QSize for explicit sizing
 import cv2
-import numpy as np
 import sys
 import os
 
 # Import functions from other files
-from image_processor import preprocess_image, detect_edges
-from fruit_detector import color_based_detection, detect_banana_ripeness
+from smartfruit.image_processor import preprocess_image, detect_edges
+from smartfruit.fruit_detector import color_based_detection, detect_banana_ripeness
+from smartfruit.frame_analysis import analyze
+from smartfruit.profiles import FRUIT_TYPES
+from gui_workers import TaskRunner, PixmapCache
+from smartfruit.image_loader import Prefetcher, list_images, read_image
+
+# Images of the same folder decoded ahead of "Next Image"
+PREFETCH_DEPTH = 2
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -20,6 +26,16 @@ class MainWindow(QMainWindow):
         self.setup_ui()
         self.original_cv_img = None # Stores the original loaded OpenCV image
         self.processed_cv_img = None # Stores the processed OpenCV image
+        self.frame = None # Shared, memoized analysis of the original image
+        self.results = {} # Processed images of the current frame, keyed by operation
+        self.image_path = None # Path of the loaded image, used by "Next Image"
+
+        # OpenCV work runs in a thread pool so the window stays responsive
+        self.runner = TaskRunner(self)
+        self.runner.busy_changed.connect(self.progress_bar.setVisible)
+        self.runner.failed.connect(self.show_processing_error)
+        self.pixmap_cache = PixmapCache()
+        self.prefetcher = Prefetcher(load_frame, depth=PREFETCH_DEPTH)
 
     def setup_ui(self):
         # Image Display Labels (Original and Processed)
@@ -41,10 +57,18 @@ class MainWindow(QMainWindow):
         self.processed_image_info_label.setFont(font_info)
         self.processed_image_info_label.setFixedHeight(30) # Give it a fixed height
 
+        # Busy indicator shown while a background task is running
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 0) # Indeterminate
+        self.progress_bar.setFixedHeight(12)
+        self.progress_bar.setTextVisible(False)
+        self.progress_bar.setVisible(False)
+
         # Layout for the processed image area (image + info label)
         processed_area_layout = QVBoxLayout()
         processed_area_layout.addWidget(self.processed_image_display_label, 1) # Image display gets more stretch
         processed_area_layout.addWidget(self.processed_image_info_label, 0) # Info label takes less space
+        processed_area_layout.addWidget(self.progress_bar, 0)
 
         # Layout for Image Displays
         image_display_layout = QHBoxLayout()
@@ -56,6 +80,7 @@ class MainWindow(QMainWindow):
         gbox_font = QFont("Arial", 10, QFont.Bold)
         self.gbox_rtm2.setFont(gbox_font)
         btn_load = QPushButton("📁 Load Image")
+        btn_next = QPushButton("Next Image ▶")
         btn_grayscale = QPushButton("Grayscale")
         btn_contrast = QPushButton("Enhance Contrast")
         btn_edges = QPushButton("Detect Edges")
@@ -64,13 +89,14 @@ class MainWindow(QMainWindow):
         self.gbox_rtm3 = QGroupBox("Fruit Detection (RTM3)")
         self.gbox_rtm3.setFont(gbox_font)
         self.cb_fruit_type = QComboBox()
-        self.cb_fruit_type.addItems(["All Fruits", "Apple", "Orange", "Banana"])
+        self.cb_fruit_type.addItems(["All Fruits"] + [fruit.capitalize() for fruit in FRUIT_TYPES])
         btn_detect = QPushButton("Detect Fruits")
         btn_ripeness = QPushButton("Check Banana Ripeness")
 
         # Layouts
         layout_rtm2 = QHBoxLayout()
         layout_rtm2.addWidget(btn_load)
+        layout_rtm2.addWidget(btn_next)
         layout_rtm2.addWidget(btn_grayscale)
         layout_rtm2.addWidget(btn_contrast)
         layout_rtm2.addWidget(btn_edges)
@@ -95,6 +121,7 @@ class MainWindow(QMainWindow):
 
         # Signal Connections
         btn_load.clicked.connect(self.load_image)
+        btn_next.clicked.connect(self.load_next_image)
         btn_grayscale.clicked.connect(self.apply_grayscale)
         btn_contrast.clicked.connect(self.enhance_contrast)
         btn_edges.clicked.connect(self.apply_edge_detection)
@@ -104,46 +131,100 @@ class MainWindow(QMainWindow):
     def load_image(self):
         file_path, _ = QFileDialog.getOpenFileName(filter="Images (*.jpg *.png *.jpeg)") # Added .jpeg
         if file_path:
-            self.original_cv_img = cv2.imread(file_path)
-            if self.original_cv_img is not None:
-                self.display_cv_image(self.original_cv_img, self.original_image_display_label)
-                # Clear the processed image display and reset processed image
-                self.processed_image_display_label.clear()
-                self.processed_image_display_label.setText("Processed image will appear here.")
-                self.processed_image_info_label.setText("Image loaded. Select a process.")
-                self.processed_cv_img = None
-            else:
-                print(f"Error: Could not load image from {file_path}")
-                self.original_image_display_label.setText("Failed to load image.")
-                self.processed_image_display_label.clear()
-                self.processed_image_info_label.setText("Failed to load image.")
+            self.open_image(file_path)
+
+    def load_next_image(self):
+        if self.image_path is None:
+            self.load_image()
+            return
+        siblings = list_images(os.path.dirname(self.image_path))
+        if self.image_path in siblings and siblings.index(self.image_path) + 1 < len(siblings):
+            self.open_image(siblings[siblings.index(self.image_path) + 1])
+        else:
+            self.processed_image_info_label.setText("No more images in this folder.")
+
+    def open_image(self, file_path):
+        file_path = os.path.abspath(file_path)
+        self.image_path = file_path
+        # Results of the previous image are no longer wanted
+        self.runner.cancel("process")
+        self.original_image_display_label.setText("Loading image...")
+        # Decode this image (unless it was prefetched already) and the next ones
+        # of the folder in the background
+        siblings = list_images(os.path.dirname(file_path))
+        if file_path in siblings:
+            index = siblings.index(file_path)
+            self.prefetcher.schedule(siblings[index:index + 1 + PREFETCH_DEPTH])
+        self.runner.submit("load", self.prefetcher.get, (file_path,),
+                           lambda frame: self.on_image_loaded(file_path, frame))
+
+    def on_image_loaded(self, file_path, frame):
+        if frame is not None:
+            self.frame = frame
+            self.original_cv_img = frame.img
+            self.results = {}
+            self.display_cv_image(self.original_cv_img, self.original_image_display_label)
+            # Clear the processed image display and reset processed image
+            self.processed_image_display_label.clear()
+            self.processed_image_display_label.setText("Processed image will appear here.")
+            self.processed_image_info_label.setText("Image loaded. Select a process.")
+            self.processed_cv_img = None
+        else:
+            print(f"Error: Could not load image from {file_path}")
+            self.frame = None
+            self.original_cv_img = None
+            self.results = {}
+            self.original_image_display_label.setText("Failed to load image.")
+            self.processed_image_display_label.clear()
+            self.processed_image_info_label.setText("Failed to load image.")
+
+    def run_processing(self, key, fn, args, info_text):
+        """Run fn(*args) in the background and show its result, reusing earlier results for key."""
+        if key in self.results:
+            self.runner.cancel("process")
+            self.show_processed_image(self.results[key], info_text)
+            return
+        self.processed_image_info_label.setText("Processing...")
+        frame = self.frame
+        self.runner.submit("process", fn, args,
+                           lambda result: self.on_processing_done(frame, key, result, info_text))
+
+    def on_processing_done(self, frame, key, result, info_text):
+        if frame is not self.frame:
+            return # Finished for an image that has since been replaced
+        self.results[key] = result
+        self.show_processed_image(result, info_text)
+
+    def show_processed_image(self, result, info_text):
+        self.processed_cv_img = result
+        self.display_cv_image(self.processed_cv_img, self.processed_image_display_label)
+        self.processed_image_info_label.setText(info_text)
+
+    def show_processing_error(self, message):
+        print(f"Error: {message}")
+        self.processed_image_info_label.setText(f"Processing failed: {message}")
 
     def apply_grayscale(self):
         if self.original_cv_img is not None:
-            gray = cv2.cvtColor(self.original_cv_img, cv2.COLOR_BGR2GRAY)
-            self.processed_cv_img = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR) # Convert back for display
-            self.display_cv_image(self.processed_cv_img, self.processed_image_display_label)
-            self.processed_image_info_label.setText("Applied: Grayscale Conversion")
+            self.run_processing("grayscale", gray_to_bgr, (self.frame,),
+                                "Applied: Grayscale Conversion")
         else:
             self.processed_image_display_label.setText("Load an image first to apply grayscale.")
             self.processed_image_info_label.setText("Load an image first.")
 
     def enhance_contrast(self):
         if self.original_cv_img is not None:
-            enhanced = preprocess_image(self.original_cv_img.copy()) # Pass a copy if preprocess modifies
-            self.processed_cv_img = enhanced
-            self.display_cv_image(self.processed_cv_img, self.processed_image_display_label)
-            self.processed_image_info_label.setText("Applied: Contrast Enhancement (CLAHE)")
+            # The loaded image is read-only, so no copy is needed
+            self.run_processing("contrast", preprocess_image, (self.original_cv_img,),
+                                "Applied: Contrast Enhancement (CLAHE)")
         else:
             self.processed_image_display_label.setText("Load an image first to enhance contrast.")
             self.processed_image_info_label.setText("Load an image first.")
 
     def apply_edge_detection(self):
         if self.original_cv_img is not None:
-            edges = detect_edges(self.original_cv_img.copy()) # Pass a copy
-            self.processed_cv_img = edges
-            self.display_cv_image(self.processed_cv_img, self.processed_image_display_label)
-            self.processed_image_info_label.setText("Applied: Edge Detection (Canny)")
+            self.run_processing("edges", detect_edges, (self.original_cv_img,),
+                                "Applied: Edge Detection (Canny)")
         else:
             self.processed_image_display_label.setText("Load an image first to detect edges.")
             self.processed_image_info_label.setText("Load an image first.")
@@ -151,22 +232,17 @@ class MainWindow(QMainWindow):
     def detect_fruits(self):
         if self.original_cv_img is not None:
             fruit_type = self.cb_fruit_type.currentText()
-            # Pass a copy of the original image for detection
-            result = color_based_detection(self.original_cv_img.copy(), fruit_type)
-            self.processed_cv_img = result
-            self.display_cv_image(self.processed_cv_img, self.processed_image_display_label)
-            self.processed_image_info_label.setText(f"Applied: Fruit Detection ({fruit_type})")
+            # Masks and blobs are memoized in self.frame, so other fruit types are cheap too
+            self.run_processing(("detect", fruit_type), color_based_detection, (self.frame, fruit_type),
+                                f"Applied: Fruit Detection ({fruit_type})")
         else:
             self.processed_image_display_label.setText("Load an image first to detect fruits.")
             self.processed_image_info_label.setText("Load an image first.")
 
     def check_banana_ripeness(self):
         if self.original_cv_img is not None:
-            # Pass a copy of the original image for ripeness detection
-            result = detect_banana_ripeness(self.original_cv_img.copy())
-            self.processed_cv_img = result
-            self.display_cv_image(self.processed_cv_img, self.processed_image_display_label)
-            self.processed_image_info_label.setText("Applied: Banana Ripeness Check")
+            self.run_processing("ripeness", detect_banana_ripeness, (self.frame,),
+                                "Applied: Banana Ripeness Check")
         else:
             self.processed_image_display_label.setText("Load an image first to check banana ripeness.")
             self.processed_image_info_label.setText("Load an image first.")
@@ -177,25 +253,24 @@ class MainWindow(QMainWindow):
             target_label_widget.setText("No image to display.")
             return
 
-        # Convert to RGB for QImage
-        # Handle potential single channel images (like Canny edges output)
-        if len(cv_img.shape) == 2 or cv_img.shape[2] == 1: # Grayscale or single channel
-            cv_img_display = cv2.cvtColor(cv_img, cv2.COLOR_GRAY2RGB) if len(cv_img.shape) == 2 else cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB) # Canny might return BGR
-        else:
-            cv_img_display = cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB)
-
-        img_rgb = cv_img_display # Use the prepared image for QImage
-        h, w, ch = img_rgb.shape
-        bytes_per_line = ch * w
-        q_img = QImage(img_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        
-        # Scale the QPixmap to fit the QLabel while maintaining aspect ratio
-        # Use image_label.size() for more responsive scaling
-        pixmap = QPixmap.fromImage(q_img)
-        target_label_widget.setPixmap(pixmap.scaled(
-            target_label_widget.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        # Scale the QPixmap to fit the QLabel while maintaining aspect ratio.
+        # Conversions and scaled pixmaps are cached, so redisplaying is free.
+        target_label_widget.setPixmap(self.pixmap_cache.get(cv_img, target_label_widget.size()))
         target_label_widget.setAlignment(Qt.AlignCenter) # Ensure alignment is set after pixmap
 
+def load_frame(file_path):
+    """Read an image and prepare its shared analysis (runs in a worker thread).
+
+    The image is decoded at full resolution: the detection area thresholds
+    are in full-resolution pixels, and results match batch_cli.py.
+    """
+    img = read_image(file_path)
+    return analyze(img) if img is not None else None
+
+def gray_to_bgr(frame):
+    """Grayscale version of a frame, converted back to BGR for display."""
+    return cv2.cvtColor(frame.gray, cv2.COLOR_GRAY2BGR)
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     app.setStyle('Fusion')
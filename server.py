@@ -0,0 +1,408 @@
+"""Local inference server for fruit detection over HTTP (TCP or Unix socket).
+
+Requests are grouped into micro-batches: a batch is dispatched when it holds
+--max-batch images or when its first image has waited --max-delay-ms. Images
+are decoded in the server and written into a shared memory segment; worker
+processes map the segment and run the detectors on the frames in place, so
+only the small detection results are pickled.
+
+Endpoints:
+    POST /detect?fruit=Banana&mode=both   body: an encoded image (JPEG, PNG, ...)
+    GET  /metrics                         Prometheus text: latency quantiles, queue depth, batches
+    GET  /stats                           the same as JSON
+
+Example:
+    python server.py --port 8765 --workers 4
+    curl --data-binary @apple.jpg "http://127.0.0.1:8765/detect?mode=both"
+    python server.py --unix /tmp/smartfruit.sock
+    curl --unix-socket /tmp/smartfruit.sock --data-binary @apple.jpg http://localhost/detect
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+
+from smartfruit import profiling
+from smartfruit.image_processor import get_label_lut
+from smartfruit.frame_analysis import FrameAnalysis
+from smartfruit.fruit_detector import FRUIT_TYPES, detect_fruit_blobs, detections_to_json, find_banana_ripeness
+
+MODES = ("fruits", "ripeness", "both")
+MAX_REQUEST_BYTES = 64 << 20
+SEGMENT_ROUNDING = 1 << 20 # Shared memory segments grow in whole MiB
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large", 500: "Internal Server Error"}
+
+def detect_frame(img, fruit="All Fruits", mode="fruits"):
+    """Run the detectors selected by mode on one BGR frame and return a JSON-ready dict."""
+    frame = FrameAnalysis(img)
+    # Ripeness first, so fruit detection reuses its banana components instead of labelling again
+    bananas = find_banana_ripeness(frame) if mode in ("ripeness", "both") else None
+    fruits = detect_fruit_blobs(frame, fruit) if mode in ("fruits", "both") else None
+    return detections_to_json(fruits, bananas)
+
+# Worker side: shared memory segments mapped by this process, most recently used last
+_attached = collections.OrderedDict()
+_MAX_ATTACHED = 8
+
+def _init_worker(profile):
+    """Pool initializer: one OpenCV thread per worker, lookup table built before the first request."""
+    cv2.setNumThreads(1)
+    get_label_lut()
+    if profile:
+        profiling.enable()
+
+def _attach(name):
+    shm = _attached.get(name)
+    if shm is not None:
+        _attached.move_to_end(name)
+        return shm
+    shm = _attached[name] = shared_memory.SharedMemory(name=name)
+    # The server replaces segments that became too small, drop our mappings of old ones
+    while len(_attached) > _MAX_ATTACHED:
+        _attached.popitem(last=False)[1].close()
+    return shm
+
+def _process_batch(name, items):
+    """Worker entry point: detect on the (offset, shape, fruit, mode) frames in segment name.
+
+    Returns one (result, trace) pair per frame.
+    """
+    shm = _attach(name)
+    results = []
+    for i, (offset, shape, fruit, mode) in enumerate(items):
+        start = time.perf_counter()
+        with profiling.frame(i, record=False) as trace:
+            try:
+                result = detect_frame(np.ndarray(shape, np.uint8, shm.buf, offset), fruit, mode)
+            except Exception as e:
+                result = {"error": str(e)}
+        result["worker_ms"] = round((time.perf_counter() - start) * 1000.0, 3)
+        results.append((result, trace))
+    return results
+
+class SharedFrameBuffers:
+    """Reusable shared memory segments holding the frames of in-flight batches."""
+
+    def __init__(self):
+        self._free = []
+        self._segments = set()
+
+    def acquire(self, nbytes):
+        """Return a free segment of at least nbytes, replacing a too-small one if needed."""
+        for i, shm in enumerate(self._free):
+            if shm.size >= nbytes:
+                return self._free.pop(i)
+        if self._free:
+            self._destroy(self._free.pop(0))
+        size = max(SEGMENT_ROUNDING, -(-nbytes // SEGMENT_ROUNDING) * SEGMENT_ROUNDING)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        self._segments.add(shm)
+        return shm
+
+    def release(self, shm):
+        self._free.append(shm)
+
+    def _destroy(self, shm):
+        self._segments.discard(shm)
+        shm.close()
+        shm.unlink()
+
+    def close(self):
+        for shm in list(self._segments):
+            self._destroy(shm)
+        self._free.clear()
+
+class InferenceServer:
+    """Micro-batches detection requests onto a pool of worker processes."""
+
+    def __init__(self, workers=None, max_batch=8, max_delay_ms=5.0, latency_window=10000, profile=False):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000.0
+        self.profile = profile
+        self.buffers = SharedFrameBuffers()
+        self.latencies = collections.deque(maxlen=latency_window) # seconds, most recent requests
+        self.counters = {"requests": 0, "errors": 0, "batches": 0, "batched_images": 0,
+                         "latency_sum_seconds": 0.0}
+        self.in_flight = 0
+        self.max_queue_depth = 0
+        self.queue = None
+        self.pool = None
+        self._batcher = None
+        self._tasks = set()
+
+    async def start(self):
+        # Build the lookup table once here, forked workers then inherit it
+        get_label_lut()
+        # Workers share the parent's shared memory tracker; one of their own would
+        # unlink the server's segments when the worker exits
+        resource_tracker.ensure_running()
+        self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.profile,))
+        # Start the workers now: forked later, they would inherit the client sockets open
+        # at that moment and keep those connections from closing
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, os.getpid) for _ in range(self.workers)))
+        self.queue = asyncio.Queue()
+        # Two batches per worker in flight: one running, one waiting in its queue
+        self._slots = asyncio.Semaphore(2 * self.workers)
+        self._batcher = asyncio.create_task(self._run_batcher())
+
+    async def stop(self):
+        if self._batcher is not None:
+            self._batcher.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+        self.buffers.close()
+
+    async def detect(self, img, fruit="All Fruits", mode="fruits"):
+        """Queue one decoded frame for the next micro-batch and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((img, fruit, mode, future))
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return await future
+
+    async def _run_batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._slots.acquire()
+            task = asyncio.create_task(self._dispatch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, batch):
+        loop = asyncio.get_running_loop()
+        self.in_flight += len(batch)
+        shm = self.buffers.acquire(sum(img.nbytes for img, _, _, _ in batch))
+        try:
+            items = []
+            offset = 0
+            for img, fruit, mode, _ in batch:
+                np.ndarray(img.shape, np.uint8, shm.buf, offset)[...] = img
+                items.append((offset, img.shape, fruit, mode))
+                offset += img.nbytes
+            results = await loop.run_in_executor(self.pool, _process_batch, shm.name, items)
+        except Exception as e:
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            self.counters["batches"] += 1
+            self.counters["batched_images"] += len(batch)
+            for (_, _, _, future), (result, trace) in zip(batch, results):
+                profiling.add_trace(trace)
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self.buffers.release(shm)
+            self.in_flight -= len(batch)
+            self._slots.release()
+
+    def record_latency(self, seconds, failed=False):
+        self.latencies.append(seconds)
+        self.counters["requests"] += 1
+        self.counters["errors"] += failed
+        self.counters["latency_sum_seconds"] += seconds
+
+    def stats(self):
+        """JSON-ready latency percentiles, queue depth and batching counters."""
+        latencies = np.array(self.latencies) * 1000.0
+        percentiles = {}
+        for q in (50, 90, 99):
+            percentiles[f"p{q}_ms"] = round(float(np.percentile(latencies, q)), 3) if len(latencies) else 0.0
+        batches = self.counters["batches"]
+        return {
+            **percentiles,
+            "requests": self.counters["requests"],
+            "errors": self.counters["errors"],
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": self.in_flight,
+            "batches": batches,
+            "mean_batch_size": round(self.counters["batched_images"] / batches, 2) if batches else 0.0,
+            "workers": self.workers,
+        }
+
+    def export_prometheus(self, prefix="smartfruit"):
+        stats = self.stats()
+        lines = [f"# HELP {prefix}_request_seconds Detection request latency over the last "
+                 f"{self.latencies.maxlen} requests.",
+                 f"# TYPE {prefix}_request_seconds summary"]
+        for q in (50, 90, 99):
+            lines.append(f'{prefix}_request_seconds{{quantile="{q / 100}"}} {stats[f"p{q}_ms"] / 1000.0:.6f}')
+        lines += [f"{prefix}_request_seconds_sum {self.counters['latency_sum_seconds']:.6f}",
+                  f"{prefix}_request_seconds_count {stats['requests']}",
+                  f"# TYPE {prefix}_request_errors_total counter",
+                  f"{prefix}_request_errors_total {stats['errors']}",
+                  f"# TYPE {prefix}_queue_depth gauge",
+                  f"{prefix}_queue_depth {stats['queue_depth']}",
+                  f"# TYPE {prefix}_in_flight_images gauge",
+                  f"{prefix}_in_flight_images {stats['in_flight']}",
+                  f"# TYPE {prefix}_batches_total counter",
+                  f"{prefix}_batches_total {stats['batches']}",
+                  f"# TYPE {prefix}_batched_images_total counter",
+                  f"{prefix}_batched_images_total {self.counters['batched_images']}"]
+        text = "\n".join(lines) + "\n"
+        if profiling.is_enabled():
+            text += profiling.export_prometheus(prefix)
+        return text
+
+    async def handle_detect(self, query, body):
+        """POST /detect: decode the body, run it through a micro-batch and return (status, result)."""
+        fruit = query.get("fruit", ["All Fruits"])[0]
+        mode = query.get("mode", ["fruits"])[0]
+        if fruit != "All Fruits" and fruit.lower() not in FRUIT_TYPES:
+            return 400, {"error": f"unknown fruit {fruit!r}"}
+        if mode not in MODES:
+            return 400, {"error": f"unknown mode {mode!r}, expected one of {', '.join(MODES)}"}
+
+        if not body:
+            return 400, {"error": "empty body"}
+
+        # imdecode releases the GIL, so decoding on the default thread pool keeps the loop responsive
+        img = await asyncio.get_running_loop().run_in_executor(
+            None, cv2.imdecode, np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            return 400, {"error": "could not decode image"}
+        result = await self.detect(img, fruit, mode)
+        result["height"], result["width"] = img.shape[:2]
+        return (500 if "error" in result else 200), result
+
+    async def handle_client(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection, keeping it alive between requests."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = request_line.split(" ", 2)
+                except ValueError:
+                    break
+                headers = {}
+                for line in header_lines:
+                    name, sep, value = line.partition(":")
+                    if sep:
+                        headers[name.strip().lower()] = value.strip()
+                length = headers.get("content-length") or "0"
+                # int() would also accept signs, underscores and non-ASCII digits
+                if not (length.isascii() and length.isdigit()):
+                    # Without a valid length the body can't be skipped, so close the connection
+                    await self._respond(writer, 400, {"error": f"invalid Content-Length {length!r}"}, False)
+                    break
+                length = int(length)
+                if length > MAX_REQUEST_BYTES:
+                    await self._respond(writer, 413, {"error": "request body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                url = urlsplit(target)
+                start = time.perf_counter()
+                if url.path == "/detect":
+                    if method != "POST":
+                        status, payload = 405, {"error": "use POST"}
+                    else:
+                        try:
+                            status, payload = await self.handle_detect(parse_qs(url.query), body)
+                        except Exception as e:
+                            status, payload = 500, {"error": str(e)}
+                        self.record_latency(time.perf_counter() - start, status != 200)
+                elif url.path == "/metrics":
+                    status, payload = 200, self.export_prometheus()
+                elif url.path == "/stats":
+                    status, payload = 200, self.stats()
+                else:
+                    status, payload = 404, {"error": f"no such endpoint {url.path!r}"}
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+        writer.write((f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                      f"Content-Type: {content_type}\r\n"
+                      f"Content-Length: {len(body)}\r\n"
+                      f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+async def serve(server, host="127.0.0.1", port=8765, unix_path=None):
+    """Run server until cancelled or terminated, listening on a Unix socket if unix_path is given."""
+    if sys.platform != "win32":
+        # Shut down cleanly (workers, shared memory, socket file) when a service manager stops us
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    await server.start()
+    try:
+        if unix_path:
+            listener = await asyncio.start_unix_server(server.handle_client, unix_path)
+            where = unix_path
+        else:
+            listener = await asyncio.start_server(server.handle_client, host, port)
+            where = f"http://{host}:{port}"
+        print(f"Serving on {where} with {server.workers} workers "
+              f"(batches of up to {server.max_batch}, {server.max_delay * 1000.0:g} ms deadline)", file=sys.stderr)
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.stop()
+        if unix_path and os.path.exists(unix_path):
+            os.unlink(unix_path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve fruit detection over local HTTP with micro-batching.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", metavar="PATH", help="Listen on this Unix socket instead of TCP")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--max-batch", type=int, default=8, help="Images per micro-batch (default 8)")
+    parser.add_argument("--max-delay-ms", type=float, default=5.0,
+                        help="Longest time a request waits for its batch to fill (default 5)")
+    parser.add_argument("--profile", action="store_true", help="Add per-stage timings to /metrics")
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        profiling.enable()
+    server = InferenceServer(args.workers, args.max_batch, args.max_delay_ms, profile=args.profile)
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.unix))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""GUI-free core of SmartFruit Analyzer: segmentation, fruit detection and banana ripeness grading.
+
+Submodules and the names below are imported on first access, so
+`import smartfruit` loads neither OpenCV nor NumPy, and a process only pays
+for the parts it uses:
+
+    import smartfruit
+    blobs = smartfruit.detect_fruit_blobs(img)  # loads image_processor, frame_analysis, fruit_detector
+    smartfruit.profiles.register_profile("lime", [((35, 120, 80), (50, 255, 255))])
+
+Check the import cost of the entry points with `python -m smartfruit.import_budget`.
+"""
+import importlib
+
+SUBMODULES = (
+    "profiles", "profiling", "image_processor", "frame_analysis", "fruit_detector",
+    "pyramid", "tiled", "image_loader", "result_store", "import_budget",
+)
+
+# Public name -> submodule defining it
+_EXPORTS = {
+    "register_profile": "profiles",
+    "get_profile": "profiles",
+    "load_profiles": "profiles",
+    "FRUIT_TYPES": "profiles",
+    "preprocess_image": "image_processor",
+    "preprocess_batch": "image_processor",
+    "segment_fruits": "image_processor",
+    "segment_fruits_batch": "image_processor",
+    "label_fruits": "image_processor",
+    "detect_edges": "image_processor",
+    "BatchBuffers": "image_processor",
+    "analyze": "frame_analysis",
+    "FrameAnalysis": "frame_analysis",
+    "DETECTION_DTYPE": "fruit_detector",
+    "detect_fruit_blobs": "fruit_detector",
+    "detect_fruit_blobs_batch": "fruit_detector",
+    "find_fruits": "fruit_detector",
+    "find_banana_ripeness": "fruit_detector",
+    "color_based_detection": "fruit_detector",
+    "detect_banana_ripeness": "fruit_detector",
+    "detections_to_json": "fruit_detector",
+    "detect_pyramid": "pyramid",
+    "detect_tiled": "tiled",
+    "read_image": "image_loader",
+    "ThumbnailCache": "image_loader",
+    "ResultStore": "result_store",
+}
+
+__all__ = sorted(_EXPORTS)
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        return importlib.import_module("." + name, __name__)
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module("." + module, __name__), name)
+    globals()[name] = value # Later lookups skip __getattr__
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(SUBMODULES) | set(_EXPORTS))
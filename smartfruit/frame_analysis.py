@@ -0,0 +1,177 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from . import profiles, profiling
+
+from .image_processor import label_fruits, labels_to_masks, FRUIT_LABEL_BITS
+
+def image_hash(img):
+    """Content hash of an image, including its shape and dtype."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{img.shape}{img.dtype}".encode())
+    h.update(np.ascontiguousarray(img).data)
+    return h.hexdigest()
+
+class FrameAnalysis:
+    """Lazily computed, memoized color conversions, masks and blobs of one BGR frame.
+
+    Every intermediate result is computed at most once and returned read-only,
+    so several detectors can share them without copying.
+    """
+
+    def __init__(self, img, key=None, on_grow=None):
+        self.img = img
+        self.key = key
+        self.nbytes = img.nbytes
+        self._results = {}
+        self._on_grow = on_grow
+
+    def _memoize(self, name, compute):
+        result = self._results.get(name)
+        if result is None:
+            result = compute()
+            if isinstance(result, dict):
+                arrays = result.values()
+            elif isinstance(result, (tuple, list)):
+                arrays = result
+            else:
+                arrays = [result]
+            for array in arrays:
+                if isinstance(array, np.ndarray):
+                    array.setflags(write=False)
+                    self.nbytes += array.nbytes
+            self._results[name] = result
+            if self._on_grow is not None:
+                self._on_grow()
+        return result
+
+    @property
+    def hsv(self):
+        return self._memoize('hsv', lambda: cv2.cvtColor(self.img, cv2.COLOR_BGR2HSV))
+
+    @property
+    def lab(self):
+        return self._memoize('lab', lambda: cv2.cvtColor(self.img, cv2.COLOR_BGR2LAB))
+
+    @property
+    def gray(self):
+        return self._memoize('gray', lambda: cv2.cvtColor(self.img, cv2.COLOR_BGR2GRAY))
+
+    @property
+    def labels(self):
+        """uint8 fruit label map, see image_processor.label_fruits()."""
+        return self._memoize('labels', lambda: label_fruits(self.img))
+
+    @property
+    def masks(self):
+        """Per-fruit 0/255 masks, as returned by segment_fruits()."""
+        return self._memoize('masks', lambda: labels_to_masks(self.labels))
+
+    def mask(self, fruit):
+        """0/255 mask of a single fruit, or None for unknown fruits."""
+        if fruit not in FRUIT_LABEL_BITS:
+            return None
+        return self.masks[fruit]
+
+    def contours(self, fruit):
+        """External contours of a fruit's mask."""
+        def find():
+            mask = self.mask(fruit)
+            with profiling.stage("detect.contours"):
+                contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            return contours
+        return self._memoize(('contours', fruit), find)
+
+    def components(self, fruit):
+        """8-connected components of a fruit's mask as (labels, stats, centroids)."""
+        def find():
+            mask = self.mask(fruit)
+            with profiling.stage("detect.components"):
+                _, labels, stats, centroids = cv2.connectedComponentsWithStats(
+                    mask, connectivity=8, ltype=cv2.CV_32S)
+            return labels, stats, centroids
+        return self._memoize(('components', fruit), find)
+
+    def component_stats(self, fruit):
+        """(stats, centroids) of a fruit's 8-connected components.
+
+        Unlike components(), the int32 component image is dropped rather than
+        memoized; if components() already ran, its results are reused.
+        """
+        found = self._results.get(('components', fruit))
+        if found is not None:
+            return found[1:]
+        def find():
+            mask = self.mask(fruit)
+            with profiling.stage("detect.components"):
+                _, _, stats, centroids = cv2.connectedComponentsWithStats(
+                    mask, connectivity=8, ltype=cv2.CV_32S)
+            return stats, centroids
+        return self._memoize(('component_stats', fruit), find)
+
+class FrameCache:
+    """LRU cache of FrameAnalysis objects keyed on image content, bounded by memory size."""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def nbytes(self):
+        return sum(frame.nbytes for frame in self._frames.values())
+
+    def get(self, img):
+        """Return the FrameAnalysis for img, reusing a cached one with identical content."""
+        # Frames analysed before a fruit profile was registered are not reused
+        key = f"{image_hash(img)}/{profiles.generation()}"
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+                self.hits += 1
+                return frame
+            self.misses += 1
+            # Keep a private read-only copy so later edits to img can't corrupt the cache
+            img = img.copy()
+            img.setflags(write=False)
+            frame = self._frames[key] = FrameAnalysis(img, key, on_grow=self._evict)
+        self._evict()
+        return frame
+
+    def _evict(self):
+        """Drop least recently used frames until the cache fits in max_bytes.
+           The most recent frame is always kept, even if it alone is larger.
+        """
+        with self._lock:
+            total = self.nbytes
+            while total > self.max_bytes and len(self._frames) > 1:
+                _, frame = self._frames.popitem(last=False)
+                total -= frame.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+
+_default_cache = FrameCache()
+
+def analyze(img):
+    """Return the shared FrameAnalysis for a BGR image (or pass a FrameAnalysis through)."""
+    if isinstance(img, FrameAnalysis):
+        return img
+    return _default_cache.get(img)
+
+def as_frame(img):
+    """Wrap a BGR image in a private, uncached FrameAnalysis (or pass a FrameAnalysis through).
+
+    Unlike analyze(), the image is neither hashed nor copied, and the results
+    are freed with the returned object.
+    """
+    if isinstance(img, FrameAnalysis):
+        return img
+    return FrameAnalysis(img)
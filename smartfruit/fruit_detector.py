@@ -0,0 +1,343 @@
+import cv2
+import numpy as np
+from .image_processor import group_by_shape, label_fruits_stack
+from .frame_analysis import as_frame
+from . import profiling
+# Fruit types in the order used by the 'fruit' field of DETECTION_DTYPE, label
+# bits and box colors per fruit type (B,G,R), from the profile registry
+from .profiles import FRUIT_BOX_COLORS, FRUIT_LABEL_BITS, FRUIT_TYPES
+
+# Minimum blob area in pixels for a detection (filters small noise, adjust as needed)
+FRUIT_MIN_AREA = 1000
+BANANA_MIN_AREA = 300 # Lower threshold to catch smaller or less-defined bananas
+
+# One detected blob: connected-component label, bounding box (x, y, w, h),
+# pixel area, centroid (x, y) and index into FRUIT_TYPES
+DETECTION_DTYPE = np.dtype([
+    ('label', np.int32),
+    ('bbox', np.int32, (4,)),
+    ('area', np.int32),
+    ('centroid', np.float32, (2,)),
+    ('fruit', np.uint8),
+])
+
+# Define labels and colors for 7 ripeness levels
+RIPENESS_LEVEL_INFO = [
+    {"label": "Level 1 (Hard Green)", "box_color": (0, 255, 0)},
+    {"label": "Level 2 (Green-Yellowish)", "box_color": (0, 200, 50)},
+    {"label": "Level 3 (Yellow-Green)", "box_color": (0, 165, 255)},
+    {"label": "Level 4 (Fully Yellow)", "box_color": (0, 255, 255)},
+    {"label": "Level 5 (Yellow w/ Few Spots)", "box_color": (0, 255, 200)},
+    {"label": "Level 6 (Yellow w/ Many Spots)", "box_color": (0, 180, 255)},
+    {"label": "Level 7 (Mostly Spotted)", "box_color": (50, 100, 255)}
+]
+
+# Indonesian labels for the same levels
+RIPENESS_LEVEL_INFO_ID = [
+    {"label": "Level 1 (Hijau)", "box_color": (0, 255, 0)},
+    {"label": "Level 2 (Hijau Kekuningan)", "box_color": (50, 255, 0)},
+    {"label": "Level 3 (Kuning Kehijauan)", "box_color": (100, 255, 0)},
+    {"label": "Level 4 (Kuning Penuh)", "box_color": (0, 255, 255)},
+    {"label": "Level 5 (Kuning dengan Bintik Kecil)", "box_color": (0, 200, 255)},
+    {"label": "Level 6 (Bintik Cokelat Banyak)", "box_color": (0, 100, 255)},
+    {"label": "Level 7 (Sangat Matang/Cokelat)", "box_color": (0, 0, 255)},
+]
+
+# Banana pixel tones used for ripeness (OpenCV HSV, hue 0-179): pixels darker than
+# RIPENESS_BROWN_VALUE_RATIO times the brightness (value) of their banana's peel
+# are brown spots, the others are green from RIPENESS_GREEN_MIN_HUE upwards and
+# yellow below it. Relative brightness keeps the spots independent of lighting.
+RIPENESS_GREEN_MIN_HUE = 35
+RIPENESS_BROWN_VALUE_RATIO = 0.6
+RIPENESS_PEEL_PERCENTILE = 0.9 # Brightness percentile taken as the peel value
+
+# Pixels within this many pixels of a banana's outline are left out of the
+# features: blur and JPEG ringing blend them into the darker belt, so they
+# would read as brown spots on every banana
+RIPENESS_EDGE_MARGIN = 2
+
+# Yellow share of the unspotted peel separating levels 1-4, and brown-spot
+# fractions of the whole banana starting levels 5, 6 and 7
+RIPENESS_YELLOW_THRESHOLDS = (0.2, 0.5, 0.8)
+RIPENESS_BROWN_THRESHOLDS = (0.03, 0.12, 0.35)
+
+# Colour features of one banana: mean hue, yellow/(yellow + green) pixel ratio
+# and fraction of brown-spot pixels
+RIPENESS_FEATURE_DTYPE = np.dtype([
+    ('mean_hue', np.float32),
+    ('yellow_ratio', np.float32),
+    ('brown_fraction', np.float32),
+])
+
+def blobs_from_stats(stats, centroids, min_area, fruit_id):
+    """Filter connectedComponentsWithStats output by area in one vectorized step.
+
+    Returns a DETECTION_DTYPE array of the components larger than min_area
+    (the background component 0 is always skipped).
+    """
+    with profiling.stage("detect.filter"):
+        keep = np.flatnonzero(stats[1:, cv2.CC_STAT_AREA] > min_area) + 1
+        blobs = np.empty(len(keep), DETECTION_DTYPE)
+        blobs['label'] = keep
+        blobs['bbox'] = stats[keep, :4]
+        blobs['area'] = stats[keep, cv2.CC_STAT_AREA]
+        blobs['centroid'] = centroids[keep]
+        blobs['fruit'] = fruit_id
+    if profiling.is_enabled():
+        fruit = FRUIT_TYPES[fruit_id]
+        profiling.count("blobs_found", len(keep), fruit=fruit)
+        profiling.count("blobs_rejected", len(stats) - 1 - len(keep), fruit=fruit)
+    return blobs
+
+def extract_blobs(mask, min_area, fruit_id):
+    """Find the 8-connected blobs of a mask (non-zero = foreground) larger than min_area."""
+    with profiling.stage("detect.components"):
+        _, _, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8, ltype=cv2.CV_32S)
+    return blobs_from_stats(stats, centroids, min_area, fruit_id)
+
+def detect_fruit_blobs(img, target_fruit="All Fruits", min_area=FRUIT_MIN_AREA):
+    """Detect fruits based on color ranges without copying or drawing on the image.
+
+    img may be a BGR image, analysed without copying or caching it, or a
+    FrameAnalysis (e.g. from analyze()) whose intermediates are shared.
+    Returns a DETECTION_DTYPE array.
+    """
+    frame = as_frame(img)
+
+    blobs = []
+    for fruit_id, fruit in enumerate(FRUIT_TYPES):
+        if target_fruit == "All Fruits" or target_fruit.lower() == fruit:
+            stats, centroids = frame.component_stats(fruit)
+            blobs.append(blobs_from_stats(stats, centroids, min_area, fruit_id))
+
+    return np.concatenate(blobs) if blobs else np.empty(0, DETECTION_DTYPE)
+
+def detect_label_blobs(labels, target_fruit="All Fruits", min_area=FRUIT_MIN_AREA):
+    """Like detect_fruit_blobs(), for a label map from image_processor.label_fruits()."""
+    blobs = []
+    for fruit_id, fruit in enumerate(FRUIT_TYPES):
+        if target_fruit == "All Fruits" or target_fruit.lower() == fruit:
+            # Any non-zero pixel is foreground, so the masked bits can be used directly
+            blobs.append(extract_blobs(np.bitwise_and(labels, FRUIT_LABEL_BITS[fruit]), min_area, fruit_id))
+
+    return np.concatenate(blobs) if blobs else np.empty(0, DETECTION_DTYPE)
+
+def detections_to_dicts(detections):
+    """Convert a DETECTION_DTYPE array into a list of plain dicts."""
+    detected_fruits_info = []
+    for bbox, area, centroid, fruit_id in zip(detections['bbox'].tolist(), detections['area'].tolist(),
+                                              detections['centroid'].tolist(), detections['fruit'].tolist()):
+        fruit = FRUIT_TYPES[fruit_id]
+        detected_fruits_info.append({
+            'label': fruit.capitalize(),
+            'bbox': tuple(bbox),
+            'mask_area': area,
+            'centroid': tuple(centroid),
+            'fruit_type': fruit
+        })
+    return detected_fruits_info
+
+def detections_to_json(fruits=None, bananas=None):
+    """Convert detect_fruit_blobs() and find_banana_ripeness() results into a JSON-ready dict."""
+    record = {}
+    if fruits is not None:
+        record["fruits"] = [{"label": f["label"], "fruit_type": f["fruit_type"],
+                             "bbox": list(f["bbox"]), "area": f["mask_area"],
+                             "centroid": [round(c, 2) for c in f["centroid"]]}
+                            for f in detections_to_dicts(fruits)]
+    if bananas is not None:
+        record["bananas"] = [{"level": b["level"], "label": b["label"],
+                              "bbox": list(b["bbox"]), "area": b["mask_area"],
+                              "mean_hue": round(b["mean_hue"], 2), "yellow_ratio": round(b["yellow_ratio"], 4),
+                              "brown_fraction": round(b["brown_fraction"], 4)}
+                             for b in bananas]
+    return record
+
+def find_fruits(img, target_fruit="All Fruits"):
+    """Detect fruits based on color ranges and return them as a list of dicts."""
+    return detections_to_dicts(detect_fruit_blobs(img, target_fruit))
+
+def draw_fruits(img, detections):
+    """Draw bounding boxes and labels of a DETECTION_DTYPE array onto img in place."""
+    with profiling.stage("draw"):
+        for (x, y, w, h), fruit_id in zip(detections['bbox'].tolist(), detections['fruit'].tolist()):
+            fruit = FRUIT_TYPES[fruit_id]
+            box_color = FRUIT_BOX_COLORS.get(fruit, (0, 255, 0))
+
+            cv2.rectangle(img, (x, y), (x + w, y + h), box_color, 2)
+            cv2.putText(img, fruit.capitalize(), (x, y - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, box_color, 2)
+    return img
+
+def color_based_detection(img, target_fruit="All Fruits"):
+    """Detect fruits based on color ranges and draw bounding boxes.
+       Handles potential overlaps by processing masks in a specific order or by area.
+    """
+    frame = as_frame(img)
+    return draw_fruits(frame.img.copy(), detect_fruit_blobs(frame, target_fruit))
+
+def banana_ripeness_features(img, bananas):
+    """Compute the colour features of all bananas at once.
+
+    bananas is a DETECTION_DTYPE array from detect_fruit_blobs(img, "Banana", ...),
+    whose 'label' field indexes the banana component image of the same frame.
+    Every interior banana pixel (see RIPENESS_EDGE_MARGIN) is classified as
+    yellow, green or brown and the classes are counted per banana with a
+    single bincount, so the cost does not grow with the number of bananas.
+    Returns a RIPENESS_FEATURE_DTYPE array.
+    """
+    frame = as_frame(img)
+    components, stats, _ = frame.components('banana')
+    hsv = frame.hsv
+    n = len(bananas)
+    # Component label -> position in bananas, -1 for the small components that are not bananas,
+    # so that the per-banana counts below are sized by the bananas rather than by the noise
+    slot = np.full(len(stats), -1, np.intp)
+    slot[bananas['label']] = np.arange(n)
+
+    with profiling.stage("ripeness.features"):
+        # Gather the interior banana pixels once; everything below works on that list only.
+        # A 0/1 mask viewed as bool makes nonzero() several times faster than on uint8.
+        foreground = cv2.threshold(frame.mask('banana'), 0, 1, cv2.THRESH_BINARY)[1]
+        size = 2 * RIPENESS_EDGE_MARGIN + 1
+        interior = cv2.erode(foreground, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (size, size)))
+        index = np.flatnonzero(interior.view(bool))
+        owner = slot[components.reshape(-1)[index]]
+        keep = owner >= 0
+        index, owner = index[keep], owner[keep]
+
+        # Bananas too thin to have an interior are graded from all their pixels
+        thin = np.bincount(owner, minlength=n) == 0
+        if thin.any():
+            outline = np.flatnonzero(foreground.view(bool) & ~interior.view(bool))
+            outline_owner = slot[components.reshape(-1)[outline]]
+            keep = outline_owner >= 0
+            keep[keep] = thin[outline_owner[keep]]
+            index = np.concatenate([index, outline[keep]])
+            owner = np.concatenate([owner, outline_owner[keep]])
+        hue = hsv[..., 0].reshape(-1)[index]
+        value = hsv[..., 2].reshape(-1)[index]
+
+        # Peel brightness per banana: a high percentile of its value histogram,
+        # which even a mostly spotted banana's remaining peel reaches
+        hist = np.bincount(owner * 256 + value, minlength=256 * n).reshape(n, 256)
+        cdf = hist.cumsum(axis=1)
+        peel_value = np.count_nonzero(cdf < cdf[:, -1:] * RIPENESS_PEEL_PERCENTILE, axis=1)
+
+        # Tone per pixel: 0 = yellow, 1 = green, 2 = brown
+        tone = np.greater_equal(hue, RIPENESS_GREEN_MIN_HUE).view(np.uint8)
+        tone[value < peel_value[owner] * RIPENESS_BROWN_VALUE_RATIO] = 2
+        counts = np.bincount(owner * 3 + tone, minlength=3 * n).reshape(n, 3)
+        hue_sums = np.bincount(owner, weights=hue, minlength=n)
+
+        area = np.maximum(counts.sum(axis=1), 1)
+        features = np.empty(n, RIPENESS_FEATURE_DTYPE)
+        features['mean_hue'] = hue_sums / area
+        features['yellow_ratio'] = counts[:, 0] / np.maximum(counts[:, 0] + counts[:, 1], 1)
+        features['brown_fraction'] = counts[:, 2] / area
+    return features
+
+def ripeness_levels(features):
+    """Map RIPENESS_FEATURE_DTYPE features to ripeness levels 1-7.
+
+    Unspotted bananas get levels 1-4 from their yellow ratio; brown spots
+    move a banana to levels 5-7 regardless of the peel colour.
+    """
+    yellow_level = np.digitize(features['yellow_ratio'], RIPENESS_YELLOW_THRESHOLDS) + 1
+    brown_level = np.digitize(features['brown_fraction'], RIPENESS_BROWN_THRESHOLDS)
+    return np.where(brown_level > 0, 4 + brown_level, yellow_level)
+
+def detect_fruit_blobs_batch(images, target_fruit="All Fruits", min_area=FRUIT_MIN_AREA, buffers=None):
+    """detect_fruit_blobs() for an (N, H, W, 3) array or a list of images.
+
+    Equally sized images are labeled and split into connected components
+    together, one call per fruit for the whole group, which is much faster
+    than per-image calls for thumbnail-sized inputs. buffers is an optional
+    image_processor.BatchBuffers. Returns one DETECTION_DTYPE array per image,
+    with labels numbered from 1 within each image.
+    """
+    results = [None] * len(images)
+    for indices, group in group_by_shape(images):
+        labels = label_fruits_stack(group, buffers)
+        n, stride, w = labels.shape
+        tall = labels.reshape(-1, w)
+        per_image = [[] for _ in indices]
+        for fruit_id, fruit in enumerate(FRUIT_TYPES):
+            if target_fruit == "All Fruits" or target_fruit.lower() == fruit:
+                with profiling.stage("detect.components"):
+                    _, _, stats, centroids = cv2.connectedComponentsWithStats(
+                        np.bitwise_and(tall, FRUIT_LABEL_BITS[fruit]), connectivity=8, ltype=cv2.CV_32S)
+                # Separator rows keep every component inside one image, its top row tells which
+                image = stats[:, cv2.CC_STAT_TOP] // stride
+                stats[:, cv2.CC_STAT_TOP] -= image * stride
+                centroids[:, 1] -= image * stride
+                blobs = blobs_from_stats(stats, centroids, min_area, fruit_id)
+                image = image[blobs['label']]
+                order = np.argsort(image, kind='stable')
+                bounds = np.searchsorted(image[order], np.arange(1, n))
+                for j, part in enumerate(np.split(blobs[order], bounds)):
+                    per_image[j].append(part)
+
+        for j, i in enumerate(indices):
+            blobs = np.concatenate(per_image[j]) if per_image[j] else np.empty(0, DETECTION_DTYPE)
+            blobs['label'] = np.arange(1, len(blobs) + 1)
+            results[i] = blobs
+    return results
+
+def color_based_detection_batch(images, target_fruit="All Fruits", buffers=None):
+    """color_based_detection() for an (N, H, W, 3) array or a list of images.
+
+    Returns annotated copies in the same form as the input.
+    """
+    detections = detect_fruit_blobs_batch(images, target_fruit, buffers=buffers)
+    annotated = images.copy() if isinstance(images, np.ndarray) else [img.copy() for img in images]
+    for img, blobs in zip(annotated, detections):
+        draw_fruits(img, blobs)
+    return annotated
+
+def find_banana_ripeness(img):
+    """Detect bananas and grade the ripeness of each from its colour.
+       img may be a BGR image or a FrameAnalysis. Bananas are returned left to right.
+    """
+    frame = as_frame(img)
+    # The features need the component image, so label it first and let detection reuse its stats
+    frame.components('banana')
+    bananas = detect_fruit_blobs(frame, "Banana", min_area=BANANA_MIN_AREA)
+
+    # Sort bananas by their X-coordinate (left to right)
+    bananas = bananas[np.argsort(bananas['bbox'][:, 0], kind='stable')]
+
+    features = banana_ripeness_features(frame, bananas)
+    levels = ripeness_levels(features)
+
+    valid_bananas = detections_to_dicts(bananas)
+    for banana, level, mean_hue, yellow_ratio, brown_fraction in zip(
+            valid_bananas, levels.tolist(), features['mean_hue'].tolist(),
+            features['yellow_ratio'].tolist(), features['brown_fraction'].tolist()):
+        banana['level'] = level
+        banana['label'] = RIPENESS_LEVEL_INFO[level - 1]["label"]
+        banana['mean_hue'] = mean_hue
+        banana['yellow_ratio'] = yellow_ratio
+        banana['brown_fraction'] = brown_fraction
+    return valid_bananas
+
+def draw_banana_ripeness(img, bananas, level_info=RIPENESS_LEVEL_INFO):
+    """Draw bounding boxes and ripeness labels from find_banana_ripeness() onto img in place.
+       level_info gives the label and box color per level, e.g. RIPENESS_LEVEL_INFO_ID.
+    """
+    with profiling.stage("draw"):
+        for banana in bananas:
+            x, y, w, h = banana['bbox']
+            info = level_info[banana['level'] - 1]
+            box_color = info["box_color"]
+
+            # Draw the bounding box and label
+            cv2.rectangle(img, (x,y), (x+w,y+h), box_color, 2)
+            cv2.putText(img, info["label"], (x,y-10),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, box_color, 2)
+    return img
+
+def detect_banana_ripeness(img, level_info=RIPENESS_LEVEL_INFO):
+    """Detect bananas, grade their ripeness by colour and draw the levels on a copy of the image."""
+    frame = as_frame(img)
+    return draw_banana_ripeness(frame.img.copy(), find_banana_ripeness(frame), level_info)
@@ -0,0 +1,215 @@
+"""Image loading: reduced-resolution JPEG decode, an on-disk thumbnail cache and prefetching.
+
+JPEG decoders can scale by 1/2, 1/4 or 1/8 while decoding, which skips most
+of the work when the image is going to be shrunk to 800x600 anyway.
+read_image() picks the largest such reduction that still leaves the image at
+least as large as the target size.
+
+Example:
+    img = read_image("belt/0001.jpg", target_size=(800, 600))
+    thumbnails = ThumbnailCache()
+    for path, thumb in prefetch_iter(paths, thumbnails.get, depth=4):
+        detect_fruit_blobs(thumb)
+"""
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from .image_processor import preprocess_image
+
+# Size that preprocess_image() normalizes to
+THUMBNAIL_SIZE = (800, 600)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+# Decode-time scale factor -> imread flag
+REDUCED_COLOR_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Bump when the cached thumbnail content changes, so old cache files are ignored
+_CACHE_VERSION = 1
+
+def image_size(data):
+    """(width, height) read from the header of JPEG or PNG bytes, or None for other formats."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and data[12:16] == b"IHDR":
+        return struct.unpack(">II", data[16:24])
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF: # Fill byte
+            i += 1
+            continue
+        if 0xD0 <= marker <= 0xD9 or marker == 0x01: # Markers without a length
+            i += 2
+            continue
+        # Start-of-frame markers, except DHT (C4), JPG (C8) and DAC (CC), hold the image size
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    return None
+
+def is_jpeg(data):
+    return data[:2] == b"\xff\xd8"
+
+def reduction_factor(size, target_size):
+    """Largest JPEG decode scale (1, 2, 4 or 8) that keeps size at least target_size."""
+    width, height = size
+    target_width, target_height = target_size
+    for factor in (8, 4, 2):
+        if width // factor >= target_width and height // factor >= target_height:
+            return factor
+    return 1
+
+def decode_image(data, target_size=None):
+    """Decode encoded image bytes to BGR, at reduced resolution for JPEGs when target_size allows.
+
+    Returns None if the data cannot be decoded.
+    """
+    buf = np.frombuffer(data, np.uint8)
+    factor = 1
+    if target_size is not None and is_jpeg(data):
+        size = image_size(data)
+        if size is not None:
+            factor = reduction_factor(size, target_size)
+    img = cv2.imdecode(buf, REDUCED_COLOR_FLAGS[factor])
+    # The header size ignores EXIF rotation; decode again in full if that made it too small
+    if img is not None and factor > 1 and (img.shape[1] < target_size[0] or img.shape[0] < target_size[1]):
+        img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    return img
+
+def read_image(path, target_size=None):
+    """Read a BGR image, decoding JPEGs at reduced resolution when target_size allows.
+
+    The result is at least target_size (width, height) whenever the image
+    itself is, so resizing it to target_size afterwards loses no detail.
+    Returns None if the file cannot be decoded, like cv2.imread.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    return decode_image(data, target_size)
+
+def list_images(directory):
+    """Sorted paths of the image files in a directory."""
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.lower().endswith(IMAGE_EXTENSIONS)]
+
+def default_cache_dir():
+    return os.environ.get("SMARTFRUIT_CACHE_DIR") or os.path.join(
+        os.path.expanduser("~"), ".cache", "smartfruit", "thumbnails")
+
+class ThumbnailCache:
+    """On-disk cache of decoded, preprocessed (resized + CLAHE) thumbnails.
+
+    Entries are keyed by a hash of the file contents and its modification
+    time, so edited files miss, and so do copies that do not preserve the
+    modification time; renamed or moved files still hit. Several threads or
+    processes may share one cache directory.
+    """
+
+    def __init__(self, cache_dir=None, size=THUMBNAIL_SIZE):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.size = tuple(size)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, data, mtime_ns):
+        digest = hashlib.blake2b(data, digest_size=16)
+        digest.update(struct.pack("<qiii", mtime_ns, _CACHE_VERSION, *self.size))
+        return digest.hexdigest()
+
+    def get(self, path):
+        """Preprocessed thumbnail of the image at path, or None if it cannot be decoded."""
+        with open(path, "rb") as f:
+            mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+            data = f.read()
+        cache_path = os.path.join(self.cache_dir, self.key(data, mtime_ns) + ".npy")
+        try:
+            thumb = np.load(cache_path)
+            self.hits += 1
+            return thumb
+        except (OSError, ValueError):
+            pass
+
+        self.misses += 1
+        img = decode_image(data, self.size)
+        if img is None:
+            return None
+        thumb = preprocess_image(img, self.size)
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, thumb)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        return thumb
+
+class Prefetcher:
+    """Loads upcoming images on a background thread while the current one is analysed.
+
+    load(path) runs on the prefetch thread; OpenCV decoding releases the GIL,
+    so it overlaps with processing on the calling thread.
+    """
+
+    def __init__(self, load=read_image, depth=4):
+        self.load = load
+        self.depth = depth
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def schedule(self, paths):
+        """Start loading the first `depth` + 1 of paths, in order, and forget other scheduled paths."""
+        wanted = list(paths)[:self.depth + 1]
+        with self._lock:
+            for path in list(self._futures):
+                if path not in wanted:
+                    self._futures.pop(path).cancel()
+            for path in wanted:
+                if path not in self._futures:
+                    self._futures[path] = self._executor.submit(self.load, path)
+
+    def get(self, path):
+        """load(path), waiting for the prefetched result if path was scheduled."""
+        with self._lock:
+            future = self._futures.pop(path, None)
+        if future is None or future.cancelled():
+            return self.load(path)
+        return future.result()
+
+    def close(self):
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures.clear()
+        self._executor.shutdown(wait=False)
+
+def prefetch_iter(paths, load=read_image, depth=4):
+    """Yield (path, load(path)) in order while the next `depth` paths load in the background."""
+    paths = list(paths)
+    prefetcher = Prefetcher(load, depth)
+    try:
+        for i, path in enumerate(paths):
+            prefetcher.schedule(paths[i:i + depth + 1])
+            yield path, prefetcher.get(path)
+    finally:
+        prefetcher.close()
@@ -0,0 +1,263 @@
+import cv2
+import numpy as np
+from . import profiles, profiling
+
+# Fruit colour ranges and label bits come from the profile registry
+from .profiles import FRUIT_HSV_RANGES, FRUIT_LABEL_BITS
+
+def enhance_contrast(img, clip_limit=4.0, tile_grid=(8,8)):
+    """Enhance contrast of a BGR image by applying CLAHE to the L channel in LAB space."""
+    with profiling.stage("preprocess.lab"):
+        lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
+        l, a, b = cv2.split(lab)
+    
+    # Apply CLAHE to the L-channel for contrast enhancement
+    with profiling.stage("preprocess.clahe"):
+        clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid)
+        limg = clahe.apply(l)
+    
+    # Merge the enhanced L-channel with original A and B channels
+    # and convert back to BGR
+    with profiling.stage("preprocess.merge"):
+        enhanced_lab = cv2.merge([limg, a, b])
+        return cv2.cvtColor(enhanced_lab, cv2.COLOR_LAB2BGR)
+
+def preprocess_image(img, size=(800, 600)):
+    """Normalize image size and enhance contrast using CLAHE.
+       Pass size=None to keep the original resolution.
+    """
+    # It's better to process a fixed size image for consistent results,
+    # but high-resolution scans can keep their detail with size=None.
+    if size is not None:
+        with profiling.stage("preprocess.resize"):
+            img = cv2.resize(img, size, interpolation=cv2.INTER_AREA) # Added interpolation for better quality when shrinking
+    
+    return enhance_contrast(img, clip_limit=4.0, tile_grid=(8,8)) # Increased clipLimit slightly for stronger effect
+
+def segment_fruits_inrange(img):
+    """Reference segmentation: one inRange pass per HSV range on a full-frame HSV image."""
+    with profiling.stage("segment.inrange"):
+        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+
+        masks = {}
+        for fruit, ranges in FRUIT_HSV_RANGES.items():
+            mask = None
+            for lower, upper in ranges:
+                range_mask = cv2.inRange(hsv, lower, upper)
+                mask = range_mask if mask is None else cv2.bitwise_or(mask, range_mask)
+            masks[fruit] = mask
+
+    return masks
+
+def build_label_lut(bits=8):
+    """Precompute a BGR -> fruit label lookup table from the registered fruit profiles.
+
+    Each color channel is quantised to `bits` bits and the table is indexed as
+    lut[r, g, b] with the quantised values. With bits=8 the table covers every
+    BGR color (16 MB) and labels are identical to segment_fruits_inrange(); fewer
+    bits evaluate the ranges at the center of each color bin, which touches far
+    less memory per frame at the cost of some pixels on range borders.
+    """
+    levels = 1 << bits
+    step = 256 >> bits
+    values = (np.arange(levels) * step + step // 2).astype(np.uint8)
+    g, b = np.meshgrid(values, values, indexing='ij')
+
+    # The g and b axes are 256 wide whatever the quantisation so that a packed
+    # (r << 16 | g << 8 | b) pixel word can be used directly as the flat index.
+    lut = np.zeros((levels, 256, 256), np.uint8)
+    # Convert the color cube a few red planes at a time to keep temporary buffers small
+    block = max(1, (1 << 20) // (levels * levels))
+    for r0 in range(0, levels, block):
+        r_values = values[r0:r0 + block]
+        bgr = np.empty((len(r_values), levels, levels, 3), np.uint8)
+        bgr[..., 0] = b
+        bgr[..., 1] = g
+        bgr[..., 2] = r_values[:, None, None]
+        hsv = cv2.cvtColor(bgr.reshape(-1, levels, 3), cv2.COLOR_BGR2HSV)
+        labels = np.zeros(hsv.shape[:2], np.uint8)
+        for fruit, ranges in FRUIT_HSV_RANGES.items():
+            for lower, upper in ranges:
+                labels[cv2.inRange(hsv, lower, upper) != 0] |= FRUIT_LABEL_BITS[fruit]
+        lut[r0:r0 + block, :levels, :levels] = labels.reshape(len(r_values), levels, levels)
+    return lut
+
+# Lookup tables are built lazily, once per quantisation level and set of profiles
+_label_luts = {}
+
+def get_label_lut(bits=8):
+    """Return the cached lookup table for `bits`, building it on first use."""
+    key = (bits, profiles.generation())
+    lut = _label_luts.get(key)
+    if lut is None:
+        with profiling.stage("segment.build_lut"):
+            # Tables built for earlier profiles are never used again
+            for stale in [k for k in _label_luts if k[1] != key[1]]:
+                del _label_luts[stale]
+            lut = _label_luts[key] = build_label_lut(bits)
+    return lut
+
+def label_fruits(img, bits=8, out=None):
+    """Label every pixel of a BGR image with its fruit bits in a single lookup pass.
+
+    Returns a uint8 label map of the same height and width as img. `out` can be a
+    preallocated uint8 array to write the labels into.
+    """
+    lut = get_label_lut(bits)
+
+    with profiling.stage("segment.label"):
+        # Adding an alpha channel packs every pixel into one little-endian 32-bit word
+        # b | g << 8 | r << 16 | a << 24, which becomes the flat table index once alpha is dropped.
+        bgra = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
+        if bits < 8:
+            bgra >>= 8 - bits
+        index = bgra.view('<u4')[..., 0]
+        index &= 0xFFFFFF
+
+        if out is None:
+            out = np.empty(img.shape[:2], np.uint8)
+        # Indices are in range by construction, so skip numpy's bounds check
+        return np.take(lut.reshape(-1), index, out=out, mode='clip')
+
+def labels_to_masks(labels):
+    """Split a label map into the per-fruit 0/255 masks returned by segment_fruits()."""
+    with profiling.stage("segment.masks"):
+        return {fruit: cv2.threshold(np.bitwise_and(labels, bit), 0, 255, cv2.THRESH_BINARY)[1]
+                for fruit, bit in FRUIT_LABEL_BITS.items()}
+
+def segment_fruits(img):
+    """Segment fruits by color in HSV space with refined ranges, especially for banana."""
+    return labels_to_masks(label_fruits(img))
+
+def compare_segmentation(img, bits=8):
+    """Correctness check: count pixels where the lookup table disagrees with inRange.
+
+    Returns {fruit: number of mismatching pixels}; all zeros for bits=8.
+    """
+    reference = segment_fruits_inrange(img)
+    masks = labels_to_masks(label_fruits(img, bits))
+    return {fruit: int(np.count_nonzero(masks[fruit] != reference[fruit])) for fruit in reference}
+
+# --- Batch API: many images per call, sharing scratch buffers ---
+
+class BatchBuffers:
+    """Scratch buffers shared by the images of a batch.
+
+    Pass the same instance to several batch calls to also reuse the buffers
+    across batches; a buffer is reallocated only when the batch shape changes.
+    Results returned by the batch functions never alias these buffers.
+    """
+
+    def __init__(self):
+        self._arrays = {}
+
+    def get(self, name, shape, dtype=np.uint8):
+        arr = self._arrays.get(name)
+        if arr is None or arr.shape != shape or arr.dtype != dtype:
+            arr = self._arrays[name] = np.empty(shape, dtype)
+        return arr
+
+def group_by_shape(images):
+    """Split an (N, H, W, 3) array or a list of images into groups of equally sized images.
+
+    Returns a list of (indices, images) pairs, in order of first appearance,
+    and no groups when there are no images.
+    """
+    if isinstance(images, np.ndarray) and images.ndim == 4:
+        return [(list(range(len(images))), images)] if len(images) else []
+    groups = {}
+    for i, img in enumerate(images):
+        indices, members = groups.setdefault(img.shape, ([], []))
+        indices.append(i)
+        members.append(img)
+    return list(groups.values())
+
+def label_fruits_stack(images, buffers=None):
+    """Label a group of equally sized images with one lookup over the whole group.
+
+    Returns an (N, H + 1, W) uint8 label array: image i is labels[i, :H] and
+    every image is followed by an all-zero separator row, so the array can be
+    reshaped to one (N * (H + 1), W) image whose connected components never
+    span two images.
+    """
+    n = len(images)
+    h, w = images[0].shape[:2]
+    buffers = buffers or BatchBuffers()
+    lut = get_label_lut()
+
+    with profiling.stage("segment.label"):
+        labels = np.empty((n, h + 1, w), np.uint8)
+        labels[:, h] = 0
+        # One image-sized packing buffer for the whole batch stays in cache,
+        # a batch-sized one would not
+        bgra = buffers.get('bgra', (h, w, 4))
+        index = bgra.view('<u4')[..., 0]
+        flat_lut = lut.reshape(-1)
+        for i, img in enumerate(images):
+            cv2.cvtColor(img, cv2.COLOR_BGR2BGRA, dst=bgra)
+            index &= 0xFFFFFF
+            np.take(flat_lut, index, out=labels[i, :h], mode='clip')
+        return labels
+
+def label_fruits_batch(images, buffers=None):
+    """label_fruits() for an (N, H, W, 3) array or a list of images; returns a list of label maps."""
+    results = [None] * len(images)
+    for indices, group in group_by_shape(images):
+        labels = label_fruits_stack(group, buffers)
+        h = labels.shape[1] - 1
+        for j, i in enumerate(indices):
+            results[i] = labels[j, :h]
+    return results
+
+def segment_fruits_batch(images, buffers=None):
+    """segment_fruits() for an (N, H, W, 3) array or a list of images.
+
+    Labels and masks of equally sized images are computed in one pass each;
+    returns one {fruit: mask} dict per image.
+    """
+    results = [None] * len(images)
+    for indices, group in group_by_shape(images):
+        labels = label_fruits_stack(group, buffers)
+        n, h, w = labels.shape
+        masks = {fruit: mask.reshape(n, h, w) for fruit, mask in labels_to_masks(labels.reshape(-1, w)).items()}
+        for j, i in enumerate(indices):
+            results[i] = {fruit: mask[j, :h - 1] for fruit, mask in masks.items()}
+    return results
+
+def preprocess_batch(images, size=(800, 600), buffers=None):
+    """preprocess_image() for an (N, H, W, 3) array or a list of images.
+
+    One CLAHE instance and the LAB scratch buffers are shared by the whole
+    batch. Returns an (N, height, width, 3) array when size is given or the
+    input is an array, otherwise a list of images of their original sizes.
+    """
+    buffers = buffers or BatchBuffers()
+    clahe = cv2.createCLAHE(clipLimit=4.0, tileGridSize=(8, 8))
+    if size is not None:
+        out = np.empty((len(images), size[1], size[0], 3), np.uint8)
+    elif isinstance(images, np.ndarray):
+        out = np.empty_like(images)
+    else:
+        out = [np.empty_like(img) for img in images]
+
+    for i, img in enumerate(images):
+        if size is not None:
+            with profiling.stage("preprocess.resize"):
+                img = cv2.resize(img, size, dst=buffers.get('resized', (size[1], size[0], 3)),
+                                 interpolation=cv2.INTER_AREA)
+        with profiling.stage("preprocess.lab"):
+            lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB, dst=buffers.get('lab', img.shape))
+            l = cv2.extractChannel(lab, 0, dst=buffers.get('l', img.shape[:2]))
+        with profiling.stage("preprocess.clahe"):
+            limg = clahe.apply(l, dst=buffers.get('l_clahe', img.shape[:2]))
+        with profiling.stage("preprocess.merge"):
+            cv2.insertChannel(limg, lab, 0)
+            cv2.cvtColor(lab, cv2.COLOR_LAB2BGR, dst=out[i])
+    return out
+
+def detect_edges(img):
+    """Detect edges using Canny algorithm"""
+    with profiling.stage("edges"):
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        edges = cv2.Canny(gray, 100, 200)
+        return cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
@@ -0,0 +1,85 @@
+"""Import-time budget check for the SmartFruit entry points.
+
+Every entry is imported in a fresh interpreter, a few times, and fails when
+its fastest import exceeds the time budget or when it loads a module it
+must not, e.g. PyQt5 in a detection worker or the result store in a
+process that never writes results.
+
+    python -m smartfruit.import_budget              # exit status 1 on violations
+    python -m smartfruit.import_budget --scale 2    # double the time budgets on slow machines
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Entry module -> (time budget in ms, modules it must not load). The budgets
+# leave room for OpenCV and NumPy (together ~100-200 ms on a desktop) where
+# they are needed; the package itself and the profile registry must load
+# without them.
+BUDGETS = {
+    "smartfruit": (30, ("cv2", "numpy", "PyQt5")),
+    "smartfruit.profiles": (30, ("cv2", "numpy", "PyQt5")),
+    "smartfruit.profiling": (50, ("cv2", "numpy", "PyQt5")),
+    "smartfruit.fruit_detector": (400, ("PyQt5", "sqlite3", "smartfruit.result_store",
+                                        "smartfruit.pyramid", "smartfruit.image_loader")),
+    "batch_cli": (500, ("PyQt5", "sqlite3", "smartfruit.result_store", "smartfruit.pyramid")),
+    "server": (500, ("PyQt5", "sqlite3", "smartfruit.result_store")),
+    "stream": (500, ("PyQt5", "sqlite3", "smartfruit.result_store")),
+}
+
+# Directory holding the smartfruit package and the top-level scripts
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+print((time.perf_counter() - start) * 1000.0)
+print("\\n".join(sys.modules))
+"""
+
+def measure(module, repeat=3, python=sys.executable):
+    """Fastest import time of module in ms over `repeat` fresh interpreters, and the modules it loaded."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    best, loaded = None, set()
+    for _ in range(repeat):
+        out = subprocess.run([python, "-c", _PROBE.format(module=module)], cwd=ROOT, env=env,
+                             capture_output=True, text=True, check=True).stdout.split("\n")
+        ms = float(out[0])
+        best = ms if best is None else min(best, ms)
+        loaded.update(filter(None, out[1:]))
+    return best, loaded
+
+def check(budgets=BUDGETS, scale=1.0, repeat=3):
+    """Measure every entry; returns a list of (module, ms, budget ms, forbidden modules loaded)."""
+    results = []
+    for module, (budget, forbidden) in budgets.items():
+        ms, loaded = measure(module, repeat)
+        results.append((module, ms, budget * scale, sorted(m for m in forbidden if m in loaded)))
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the import time and imported modules of the entry points.")
+    parser.add_argument("modules", nargs="*", help="Entries to check (default: all of BUDGETS)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every time budget")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per entry; the fastest counts")
+    args = parser.parse_args(argv)
+
+    unknown = [m for m in args.modules if m not in BUDGETS]
+    if unknown:
+        parser.error(f"no budget for {', '.join(unknown)}")
+    budgets = {m: BUDGETS[m] for m in args.modules} if args.modules else BUDGETS
+
+    failed = 0
+    for module, ms, budget, forbidden in check(budgets, args.scale, args.repeat):
+        ok = ms <= budget and not forbidden
+        failed += not ok
+        line = f"{'ok  ' if ok else 'FAIL'} {module:<28} {ms:8.1f} ms  (budget {budget:.0f} ms)"
+        if forbidden:
+            line += "  loads " + ", ".join(forbidden)
+        print(line)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
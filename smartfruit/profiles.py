@@ -0,0 +1,87 @@
+"""Fruit colour profiles, registered as data.
+
+A profile names a fruit, lists the HSV ranges whose union is the fruit's
+colour (OpenCV scale: hue 0-179, saturation and value 0-255) and gives the
+box colour used when drawing it. Every fruit owns one bit of the uint8 label
+map, so at most 8 profiles can be registered.
+
+Example:
+    from smartfruit import profiles
+    profiles.register_profile("lime", [((35, 120, 80), (50, 255, 255))], box_color=(0, 200, 0))
+    profiles.load_profiles("fruits.json")  # [{"name": ..., "hsv_ranges": [[[h, s, v], [h, s, v]], ...]}, ...]
+
+Label lookup tables and cached frame analyses are rebuilt on the next use
+after a registration. This module only holds data and does not import OpenCV or NumPy.
+"""
+
+# A uint8 label map has room for one bit per fruit
+MAX_PROFILES = 8
+
+# Registered profiles by fruit name, in registration order
+FRUIT_PROFILES = {}
+
+# Views of FRUIT_PROFILES used by segmentation and detection, updated in place
+# by register_profile() so that modules holding a reference stay current
+FRUIT_TYPES = [] # Fruit names; the index is the 'fruit' field of DETECTION_DTYPE
+FRUIT_HSV_RANGES = {} # Fruit name -> [(lower, upper), ...]; matched with inRange and OR-ed
+FRUIT_LABEL_BITS = {} # Fruit name -> bit of the label map. Ranges may overlap (e.g. orange
+                      # and banana both accept hue 15-25), so a pixel can carry several bits.
+FRUIT_BOX_COLORS = {} # Fruit name -> (B, G, R)
+
+# Bumped on every registration, so cached lookup tables can tell they are stale
+_generation = 0
+
+def register_profile(name, hsv_ranges, box_color=(0, 255, 0)):
+    """Add a fruit colour profile, or replace the ranges and colour of an existing one.
+
+    hsv_ranges is a list of ((h, s, v) lower, (h, s, v) upper) pairs.
+    Returns the stored profile dict.
+    """
+    global _generation
+    name = name.lower()
+    ranges = [(tuple(int(v) for v in lower), tuple(int(v) for v in upper)) for lower, upper in hsv_ranges]
+    if not ranges or any(len(lower) != 3 or len(upper) != 3 for lower, upper in ranges):
+        raise ValueError(f"profile {name!r} needs at least one pair of (h, s, v) bounds")
+    if name not in FRUIT_PROFILES:
+        if len(FRUIT_PROFILES) == MAX_PROFILES:
+            raise ValueError(f"at most {MAX_PROFILES} fruit profiles fit in a label map")
+        FRUIT_LABEL_BITS[name] = 1 << len(FRUIT_TYPES)
+        FRUIT_TYPES.append(name)
+
+    profile = {"name": name, "hsv_ranges": ranges, "box_color": tuple(box_color)}
+    FRUIT_PROFILES[name] = profile
+    FRUIT_HSV_RANGES[name] = ranges
+    FRUIT_BOX_COLORS[name] = profile["box_color"]
+    _generation += 1
+    return profile
+
+def get_profile(name):
+    """Registered profile of a fruit; raises KeyError for unknown fruits."""
+    return FRUIT_PROFILES[name.lower()]
+
+def generation():
+    """Counter that changes whenever a profile is registered."""
+    return _generation
+
+def load_profiles(path):
+    """Register every profile of a JSON file holding a list of register_profile() keyword dicts."""
+    import json # Only needed here; keeps importing the registry cheap
+    with open(path, encoding="utf-8") as f:
+        return [register_profile(**entry) for entry in json.load(f)]
+
+# --- Default profiles ---
+
+register_profile("apple", [
+    ((0, 100, 100), (10, 255, 255)), # red 1
+    ((160, 100, 100), (179, 255, 255)), # red 2
+    ((60, 80, 60), (90, 255, 255)), # green apple
+], box_color=(0, 0, 255))
+
+register_profile("orange", [
+    ((10, 150, 100), (25, 255, 255)),
+], box_color=(0, 165, 255))
+
+# Broad range to include green, yellow, and brown bananas
+register_profile("banana", [
+    ((15, 40, 40), (60, 255, 255)),
+], box_color=(0, 255, 0))
@@ -0,0 +1,211 @@
+"""Stage-level timers, counters and slow-frame traces for the processing pipeline.
+
+Instrumentation is off by default and then costs one flag check per stage.
+Enable it with enable() or by setting SMARTFRUIT_PROFILE=1:
+
+    from smartfruit import profiling
+    profiling.enable(slowest_frames=10)
+    with profiling.frame("img001.jpg"):
+        color_based_detection(img)
+    print(profiling.export_prometheus())
+    profiling.dump_traces("slowest.json")
+"""
+import bisect
+import contextlib
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+# Histogram bucket upper bounds in seconds (Prometheus 'le' labels)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = os.environ.get("SMARTFRUIT_PROFILE", "") not in ("", "0")
+_null_context = contextlib.nullcontext()
+_lock = threading.Lock()
+_local = threading.local()
+_histograms = {} # stage -> [bucket counts..., +Inf count], sum, max
+_counters = {} # (name, ((label, value), ...)) -> value
+_slowest = [] # min-heap of (seconds, sequence, trace)
+_slowest_limit = 10
+_sequence = itertools.count()
+
+def enable(slowest_frames=None):
+    """Turn instrumentation on, optionally changing how many slow frame traces are kept."""
+    global _enabled, _slowest_limit
+    _enabled = True
+    if slowest_frames is not None:
+        _slowest_limit = slowest_frames
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    """Clear all recorded metrics and traces."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _slowest.clear()
+
+def _observe(stage_name, seconds):
+    with _lock:
+        hist = _histograms.get(stage_name)
+        if hist is None:
+            hist = _histograms[stage_name] = [[0] * (len(BUCKETS) + 1), 0.0, 0.0]
+        hist[0][bisect.bisect_left(BUCKETS, seconds)] += 1
+        hist[1] += seconds
+        hist[2] = max(hist[2], seconds)
+
+def _add(name, value, labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        trace = getattr(_local, "trace", None)
+        if trace is not None:
+            trace["stages"].append({"stage": self.name, "start_ms": round((self.start - trace["_start"]) * 1000.0, 3),
+                                    "ms": round(seconds * 1000.0, 3)})
+            if not trace["_record"]:
+                return False
+        _observe(self.name, seconds)
+        return False
+
+def stage(name):
+    """Context manager timing one pipeline stage into the per-stage histogram."""
+    if not _enabled:
+        return _null_context
+    return _Stage(name)
+
+def record(name, seconds):
+    """Record a stage timed elsewhere, e.g. on a prefetch thread, as if it ran here."""
+    if not _enabled:
+        return
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        start = time.perf_counter() - seconds
+        trace["stages"].append({"stage": name, "start_ms": round((start - trace["_start"]) * 1000.0, 3),
+                                "ms": round(seconds * 1000.0, 3)})
+        if not trace["_record"]:
+            return
+    _observe(name, seconds)
+
+def count(name, value=1, **labels):
+    """Increment a counter, e.g. count("blobs_rejected", 3, fruit="apple")."""
+    if not _enabled:
+        return
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        key = name + "".join(f",{k}={v}" for k, v in sorted(labels.items()))
+        trace["counters"][key] = trace["counters"].get(key, 0) + value
+        if not trace["_record"]:
+            return
+    _add(name, value, labels)
+
+@contextlib.contextmanager
+def frame(frame_id, record=True):
+    """Trace every stage of one frame; the slowest frames are kept for dump_traces().
+
+    With record=False stages are only collected in the trace (not in the
+    histograms), so another process can merge it later with add_trace().
+    Yields the trace dict, or None when profiling is disabled.
+    """
+    if not _enabled or getattr(_local, "trace", None) is not None:
+        yield None
+        return
+    trace = {"frame": frame_id, "stages": [], "counters": {}, "_start": time.perf_counter(), "_record": record}
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = None
+        trace["total_ms"] = round((time.perf_counter() - trace.pop("_start")) * 1000.0, 3)
+        trace.pop("_record")
+        if record:
+            _keep_if_slow(trace)
+
+def _keep_if_slow(trace):
+    with _lock:
+        item = (trace["total_ms"], next(_sequence), trace)
+        if len(_slowest) < _slowest_limit:
+            heapq.heappush(_slowest, item)
+        elif _slowest and item[0] > _slowest[0][0]:
+            heapq.heapreplace(_slowest, item)
+
+def add_trace(trace):
+    """Merge a frame trace recorded with record=False (e.g. in a worker process)."""
+    if not _enabled or trace is None:
+        return
+    for entry in trace["stages"]:
+        _observe(entry["stage"], entry["ms"] / 1000.0)
+    for key, value in trace["counters"].items():
+        name, *labels = key.split(",")
+        _add(name, value, dict(label.split("=", 1) for label in labels))
+    _keep_if_slow(trace)
+
+def slowest_frames():
+    """Traces of the slowest frames, slowest first."""
+    with _lock:
+        return [trace for _, _, trace in sorted(_slowest, key=lambda item: -item[0])]
+
+def snapshot():
+    """JSON-ready snapshot of all histograms and counters."""
+    with _lock:
+        stages = {}
+        for name, (buckets, total, maximum) in sorted(_histograms.items()):
+            n = sum(buckets)
+            stages[name] = {
+                "count": n,
+                "sum_seconds": round(total, 6),
+                "mean_ms": round(total / n * 1000.0, 3) if n else 0.0,
+                "max_ms": round(maximum * 1000.0, 3),
+                "buckets": {str(le): c for le, c in zip(BUCKETS + ("+Inf",), itertools.accumulate(buckets))},
+            }
+        counters = [{"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(_counters.items())]
+    return {"stages": stages, "counters": counters}
+
+def snapshot_json(indent=2):
+    return json.dumps(snapshot(), indent=indent)
+
+def _format_labels(labels):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+
+def export_prometheus(prefix="smartfruit"):
+    """Metrics in the Prometheus text exposition format."""
+    lines = [f"# HELP {prefix}_stage_seconds Time spent per pipeline stage.",
+             f"# TYPE {prefix}_stage_seconds histogram"]
+    with _lock:
+        for name, (buckets, total, _) in sorted(_histograms.items()):
+            for le, cumulative in zip(BUCKETS + ("+Inf",), itertools.accumulate(buckets)):
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {sum(buckets)}')
+        for counter in sorted({name for name, _ in _counters}):
+            lines.append(f"# TYPE {prefix}_{counter}_total counter")
+            for (name, labels), value in sorted(_counters.items()):
+                if name == counter:
+                    lines.append(f"{prefix}_{name}_total{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+def dump_traces(path):
+    """Write the slowest frame traces to a JSON file."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(slowest_frames(), f, indent=2)
@@ -0,0 +1,88 @@
+"""Coarse-to-fine fruit detection.
+
+Candidate blobs are found on a 1/2**level downscale of the frame, then
+segmentation, bounding boxes and areas are refined at full resolution only
+inside the expanded candidate regions. On mostly empty belt images this
+touches a small fraction of the full-resolution pixels.
+"""
+import cv2
+import numpy as np
+
+from .image_processor import label_fruits
+from .fruit_detector import DETECTION_DTYPE, FRUIT_MIN_AREA, detect_label_blobs
+
+def scale_area_threshold(min_area, scale):
+    """Area threshold at an image scale (e.g. 0.25 for a 1/4 downscale): areas scale with scale**2."""
+    return min_area * scale * scale
+
+def _merge_rois(rois):
+    """Merge overlapping (x0, y0, x1, y1) rectangles until they are disjoint."""
+    rois = [list(r) for r in rois]
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        for roi in rois:
+            for other in result:
+                if roi[0] < other[2] and other[0] < roi[2] and roi[1] < other[3] and other[1] < roi[3]:
+                    other[0], other[1] = min(other[0], roi[0]), min(other[1], roi[1])
+                    other[2], other[3] = max(other[2], roi[2]), max(other[3], roi[3])
+                    merged = True
+                    break
+            else:
+                result.append(roi)
+        rois = result
+    return rois
+
+def detect_pyramid(img, target_fruit="All Fruits", min_area=FRUIT_MIN_AREA, level=2, margin=16,
+                   coarse_slack=0.5, max_passes=3):
+    """Detect fruits coarse-to-fine and return a DETECTION_DTYPE array in full-resolution coordinates.
+
+    level=2 detects candidates at 1/4 scale, level=3 at 1/8. The coarse area
+    threshold is min_area scaled to that level, times coarse_slack so blobs
+    near the threshold are not lost to downscaling. Each candidate box is
+    expanded by margin full-resolution pixels; a refined blob that touches the
+    border of its region grows the region, up to max_passes times.
+    """
+    h, w = img.shape[:2]
+    factor = 1 << level
+    small = cv2.resize(img, (max(1, w // factor), max(1, h // factor)), interpolation=cv2.INTER_AREA)
+    coarse = detect_label_blobs(label_fruits(small), target_fruit,
+                                scale_area_threshold(min_area, 1.0 / factor) * coarse_slack)
+    if len(coarse) == 0:
+        return np.empty(0, DETECTION_DTYPE)
+
+    # Candidate regions in full-resolution pixels (x0, y0, x1, y1)
+    sx, sy = w / small.shape[1], h / small.shape[0]
+    boxes = coarse['bbox'].astype(np.float64)
+    rois = np.stack([boxes[:, 0] * sx - margin, boxes[:, 1] * sy - margin,
+                     (boxes[:, 0] + boxes[:, 2]) * sx + margin, (boxes[:, 1] + boxes[:, 3]) * sy + margin], axis=1)
+    rois = np.clip(np.round(rois), 0, [w, h, w, h]).astype(int).tolist()
+
+    for _ in range(max_passes):
+        rois = _merge_rois(rois)
+        blobs = []
+        grown = []
+        for x0, y0, x1, y1 in rois:
+            found = detect_label_blobs(label_fruits(img[y0:y1, x0:x1]), target_fruit, min_area)
+            found['bbox'][:, 0] += x0
+            found['bbox'][:, 1] += y0
+            found['centroid'] += (x0, y0)
+            blobs.append(found)
+
+            # Blobs cut off by an inner region border need a larger region
+            bx0, by0 = found['bbox'][:, 0], found['bbox'][:, 1]
+            bx1, by1 = bx0 + found['bbox'][:, 2], by0 + found['bbox'][:, 3]
+            cut = (((bx0 <= x0) & (x0 > 0)) | ((by0 <= y0) & (y0 > 0))
+                   | ((bx1 >= x1) & (x1 < w)) | ((by1 >= y1) & (y1 < h)))
+            for i in np.flatnonzero(cut):
+                grown.append([max(0, int(bx0[i]) - margin), max(0, int(by0[i]) - margin),
+                              min(w, int(bx1[i]) + margin), min(h, int(by1[i]) + margin)])
+        if not grown:
+            break
+        rois = rois + grown
+
+    blobs = np.concatenate(blobs)
+    # Component labels are only unique within a region, renumber them for the whole frame
+    blobs['label'] = np.arange(1, len(blobs) + 1)
+    return blobs
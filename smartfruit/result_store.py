@@ -0,0 +1,289 @@
+"""Persistent store of detection results in SQLite, with a manifest for incremental runs.
+
+Every processed image gets a manifest row holding its size, modification
+time, content hash and the hash of the pipeline parameters it was analysed
+with. Re-running over a directory skips images whose content and parameters
+are unchanged. Detections are stored one row per fruit or graded banana,
+indexed so that queries such as "all level 6+ bananas from yesterday" scan
+only the matching rows and stream them from disk.
+
+Example:
+    store = ResultStore("results.db")
+    params = store.register_params({"mode": "both"})
+    todo = store.pending(paths, params)
+    ...
+    store.add(record, params)
+    store.commit()
+    for row in store.query(fruit="banana", min_level=6, since=day_start(-1), until=day_start()):
+        print(row["path"], row["level"])
+
+Query from the command line:
+    python -m smartfruit.result_store results.db --fruit banana --min-level 6 --day yesterday
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS params (
+    hash TEXT PRIMARY KEY,
+    json TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    params_hash TEXT NOT NULL,
+    processed_at REAL NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS detections (
+    image_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,          -- 'fruit' or 'ripeness'
+    fruit TEXT NOT NULL,
+    level INTEGER,               -- ripeness level 1-7, 'ripeness' rows only
+    processed_at REAL NOT NULL,  -- copied from images so time filters use the indexes
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    w INTEGER NOT NULL,
+    h INTEGER NOT NULL,
+    area INTEGER NOT NULL,
+    cx REAL,
+    cy REAL,
+    mean_hue REAL,
+    yellow_ratio REAL,
+    brown_fraction REAL
+);
+CREATE INDEX IF NOT EXISTS detections_image ON detections (image_id);
+CREATE INDEX IF NOT EXISTS detections_fruit_time ON detections (fruit, kind, processed_at);
+CREATE INDEX IF NOT EXISTS detections_ripeness_time ON detections (processed_at, level) WHERE level IS NOT NULL;
+CREATE INDEX IF NOT EXISTS images_processed_at ON images (processed_at);
+"""
+
+# Read files in 1 MB blocks when hashing
+_HASH_BLOCK = 1 << 20
+
+def file_digest(path):
+    """blake2b hex digest of a file's contents."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def params_hash(params):
+    """Stable hash of a JSON-serialisable dict of pipeline parameters."""
+    text = json.dumps(params, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+def day_start(offset=0):
+    """Unix time of local midnight `offset` days from today (-1 is the start of yesterday)."""
+    day = datetime.date.today() + datetime.timedelta(days=offset)
+    return time.mktime(day.timetuple())
+
+def parse_time(text):
+    """Unix time from 'today', 'yesterday', an ISO date or an ISO date and time."""
+    if text in ("today", "yesterday"):
+        return day_start(-1 if text == "yesterday" else 0)
+    return datetime.datetime.fromisoformat(text).timestamp()
+
+def day_range(text):
+    """(start, end) Unix times of one local day given as 'today', 'yesterday' or an ISO date."""
+    if text in ("today", "yesterday"):
+        day = datetime.date.today() - datetime.timedelta(days=text == "yesterday")
+    else:
+        day = datetime.date.fromisoformat(text)
+    return time.mktime(day.timetuple()), time.mktime((day + datetime.timedelta(days=1)).timetuple())
+
+class ResultStore:
+    """SQLite file of per-image manifests and detections.
+
+    Changes are buffered in a transaction until commit(); use the store as a
+    context manager to commit and close it at the end.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        # WAL lets queries read while a batch run is writing
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        self.close()
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        # Refresh the planner statistics of tables that changed a lot, so queries keep using the indexes
+        self.conn.execute("PRAGMA optimize")
+        self.conn.close()
+
+    def register_params(self, params):
+        """Record a parameter set in the manifest and return its hash."""
+        key = params_hash(params)
+        self.conn.execute("INSERT OR IGNORE INTO params (hash, json) VALUES (?, ?)",
+                          (key, json.dumps(params, sort_keys=True)))
+        return key
+
+    def pending(self, paths, params_key):
+        """Paths that are new, changed, failed before or were analysed with other parameters.
+
+        Files whose size and modification time match the manifest are skipped
+        without being read; files that were only touched are hashed and, if
+        their content is unchanged, skipped with their manifest updated.
+        """
+        todo = []
+        for path in paths:
+            row = self.conn.execute(
+                "SELECT size, mtime_ns, content_hash, params_hash, error FROM images WHERE path = ?",
+                (os.path.abspath(path),)).fetchone()
+            if row is None or row["params_hash"] != params_key or row["error"] is not None:
+                todo.append(path)
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                todo.append(path) # Let the run report the missing file
+                continue
+            if st.st_size == row["size"] and st.st_mtime_ns == row["mtime_ns"]:
+                continue
+            if st.st_size == row["size"] and file_digest(path) == row["content_hash"]:
+                self.conn.execute("UPDATE images SET mtime_ns = ? WHERE path = ?",
+                                  (st.st_mtime_ns, os.path.abspath(path)))
+                continue
+            todo.append(path)
+        return todo
+
+    def add(self, record, params_key, processed_at=None):
+        """Store one batch_cli record (see detections_to_json()), replacing earlier results for its path."""
+        path = os.path.abspath(record["path"])
+        processed_at = time.time() if processed_at is None else processed_at
+        try:
+            st = os.stat(path)
+            size, mtime_ns, content_hash = st.st_size, st.st_mtime_ns, file_digest(path)
+        except OSError:
+            size, mtime_ns, content_hash = -1, -1, ""
+
+        cur = self.conn.execute("SELECT id FROM images WHERE path = ?", (path,))
+        row = cur.fetchone()
+        if row is not None:
+            self.conn.execute("DELETE FROM detections WHERE image_id = ?", (row["id"],))
+            self.conn.execute("DELETE FROM images WHERE id = ?", (row["id"],))
+        image_id = self.conn.execute(
+            "INSERT INTO images (path, size, mtime_ns, content_hash, params_hash, processed_at,"
+            " width, height, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, size, mtime_ns, content_hash, params_key, processed_at,
+             record.get("width"), record.get("height"), record.get("error"))).lastrowid
+
+        rows = []
+        for f in record.get("fruits", ()):
+            x, y, w, h = f["bbox"]
+            cx, cy = f["centroid"]
+            rows.append((image_id, "fruit", f["fruit_type"], None, processed_at,
+                         x, y, w, h, f["area"], cx, cy, None, None, None))
+        for b in record.get("bananas", ()):
+            x, y, w, h = b["bbox"]
+            rows.append((image_id, "ripeness", "banana", b["level"], processed_at,
+                         x, y, w, h, b["area"], None, None,
+                         b["mean_hue"], b["yellow_ratio"], b["brown_fraction"]))
+        self.conn.executemany(
+            "INSERT INTO detections (image_id, kind, fruit, level, processed_at, x, y, w, h, area,"
+            " cx, cy, mean_hue, yellow_ratio, brown_fraction)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return image_id
+
+    def query(self, fruit=None, kind=None, min_level=None, max_level=None, since=None, until=None,
+              limit=None):
+        """Yield matching detections joined with their image path, oldest first.
+
+        since/until are Unix times (until is exclusive); a level bound implies
+        kind="ripeness", the only rows with a level. Rows are streamed from
+        the database, so arbitrarily large results are never held in memory.
+        """
+        # Only ripeness rows have a level; saying so lets (fruit, kind, processed_at) serve the query
+        if kind is None and (min_level is not None or max_level is not None):
+            kind = "ripeness"
+        where, args = [], []
+        if fruit is not None:
+            where.append("d.fruit = ?")
+            args.append(fruit)
+        if kind is not None:
+            where.append("d.kind = ?")
+            args.append(kind)
+        if min_level is not None or max_level is not None:
+            where.append("d.level BETWEEN ? AND ?")
+            args += [1 if min_level is None else min_level, 7 if max_level is None else max_level]
+        if since is not None:
+            where.append("d.processed_at >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("d.processed_at < ?")
+            args.append(until)
+        sql = ("SELECT i.path, d.kind, d.fruit, d.level, d.processed_at, d.x, d.y, d.w, d.h, d.area,"
+               " d.cx, d.cy, d.mean_hue, d.yellow_ratio, d.brown_fraction"
+               " FROM detections d JOIN images i ON i.id = d.image_id")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY d.processed_at"
+        if limit is not None:
+            sql += " LIMIT %d" % int(limit)
+        yield from self.conn.execute(sql, args)
+
+    def stats(self):
+        """Number of images, failed images and detections per fruit and kind."""
+        images, failed = self.conn.execute(
+            "SELECT COUNT(*), COUNT(error) FROM images").fetchone()
+        counts = {f"{kind}:{fruit}": n for kind, fruit, n in self.conn.execute(
+            "SELECT kind, fruit, COUNT(*) FROM detections GROUP BY kind, fruit")}
+        return {"images": images, "failed": failed, "detections": counts}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query detections stored by batch_cli.py --store.")
+    parser.add_argument("database")
+    # Any fruit profile may have been stored, so the name is not limited to the built-in fruits
+    parser.add_argument("--fruit", type=str.lower, help="Fruit profile name, e.g. banana")
+    parser.add_argument("--kind", choices=["fruit", "ripeness"])
+    parser.add_argument("--min-level", type=int)
+    parser.add_argument("--max-level", type=int)
+    parser.add_argument("--since", help="Start time: today, yesterday, ISO date or date and time")
+    parser.add_argument("--until", help="End time (exclusive), same formats as --since")
+    parser.add_argument("--day", help="Shorthand for one whole day: today, yesterday or an ISO date")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--stats", action="store_true", help="Print row counts instead of detections")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.database):
+        parser.error(f"no such database: {args.database}")
+    since = parse_time(args.since) if args.since else None
+    until = parse_time(args.until) if args.until else None
+    if args.day:
+        since, until = day_range(args.day)
+
+    with ResultStore(args.database) as store:
+        if args.stats:
+            print(json.dumps(store.stats(), indent=2))
+            return 0
+        for row in store.query(args.fruit, args.kind, args.min_level, args.max_level, since, until, args.limit):
+            print(json.dumps({key: row[key] for key in row.keys() if row[key] is not None}))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""Tiled fruit detection for very large images and raw memory-mapped frame dumps.
+
+The image is processed in tiles, optionally with CLAHE contrast enhancement
+computed over an overlapping margin, on a thread pool. Only per-tile blob
+statistics and the component ids along tile borders are kept, and blobs
+that cross tile borders are stitched back together. Peak memory therefore
+depends on the tile size and number of workers, not on the image size.
+
+Example:
+    python -m smartfruit.tiled tray_scan.png --tile-size 2048
+    python -m smartfruit.tiled frame_dump.raw --raw-shape 12000x16000 --no-enhance
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from .image_processor import FRUIT_LABEL_BITS, enhance_contrast, label_fruits
+from .fruit_detector import DETECTION_DTYPE, FRUIT_MIN_AREA, FRUIT_TYPES, detections_to_dicts
+
+# CLAHE cell size in pixels; preprocess_image uses an 8x8 grid on 800x600, i.e. ~100 px cells
+CLAHE_CELL_SIZE = 100
+
+def open_large_image(path, raw_shape=None):
+    """Open an image without copying it into memory where possible.
+
+    Raw BGR uint8 dumps (raw_shape=(height, width)) and .npy files are
+    memory-mapped, so tiles are only read from disk when processed. Other
+    formats are decoded with cv2.imread.
+    """
+    if raw_shape is not None:
+        height, width = raw_shape
+        return np.memmap(path, dtype=np.uint8, mode='r', shape=(height, width, 3))
+    if path.lower().endswith(".npy"):
+        return np.load(path, mmap_mode='r')
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        raise IOError(f"Could not read image {path!r}")
+    return img
+
+def _process_tile(img, y0, y1, x0, x1, overlap, fruit_ids, enhance):
+    """Segment one tile and return per-fruit (stats, centroids, border ids) in image coordinates."""
+    h, w = img.shape[:2]
+    py0, py1 = max(0, y0 - overlap), min(h, y1 + overlap)
+    px0, px1 = max(0, x0 - overlap), min(w, x1 + overlap)
+    region = np.ascontiguousarray(img[py0:py1, px0:px1])
+    if enhance:
+        grid = (max(1, (px1 - px0) // CLAHE_CELL_SIZE), max(1, (py1 - py0) // CLAHE_CELL_SIZE))
+        region = enhance_contrast(region, tile_grid=grid)
+    labels = label_fruits(region)[y0 - py0:y1 - py0, x0 - px0:x1 - px0]
+
+    result = {}
+    for fruit_id in fruit_ids:
+        mask = np.bitwise_and(labels, FRUIT_LABEL_BITS[FRUIT_TYPES[fruit_id]])
+        _, components, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8, ltype=cv2.CV_32S)
+        stats = stats[1:].astype(np.int64)
+        stats[:, cv2.CC_STAT_LEFT] += x0
+        stats[:, cv2.CC_STAT_TOP] += y0
+        centroids = centroids[1:] + (x0, y0)
+        # Component ids along the four borders (0 = background), used for stitching
+        borders = {
+            'top': components[0].copy(), 'bottom': components[-1].copy(),
+            'left': components[:, 0].copy(), 'right': components[:, -1].copy(),
+        }
+        result[fruit_id] = (stats, centroids, borders)
+    return result
+
+def _border_pairs(a, a_offset, b, b_offset):
+    """Global id pairs of components touching across a border (8-connectivity).
+
+    a and b are the aligned component ids on both sides of the border.
+    """
+    pairs = []
+    for shift in (-1, 0, 1):
+        if shift < 0:
+            sa, sb = a[-shift:], b[:shift]
+        elif shift > 0:
+            sa, sb = a[:-shift], b[shift:]
+        else:
+            sa, sb = a, b
+        touching = (sa > 0) & (sb > 0)
+        if touching.any():
+            pairs.append(np.stack([sa[touching] - 1 + a_offset, sb[touching] - 1 + b_offset], axis=1))
+    return pairs
+
+def _find(parent, i):
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root:
+        parent[i], i = root, parent[i]
+    return root
+
+def stitch_tiles(tiles, fruit_id, min_area):
+    """Merge the per-tile components of one fruit into image-wide blobs.
+
+    tiles maps (row, col) to the (stats, centroids, borders) of that tile.
+    Returns a DETECTION_DTYPE array of merged blobs larger than min_area.
+    """
+    offsets = {}
+    total = 0
+    for key in sorted(tiles):
+        offsets[key] = total
+        total += len(tiles[key][0])
+    if total == 0:
+        return np.empty(0, DETECTION_DTYPE)
+
+    pairs = []
+    for (row, col), (_, _, borders) in tiles.items():
+        off = offsets[(row, col)]
+        if (row, col + 1) in tiles: # right neighbour
+            pairs += _border_pairs(borders['right'], off, tiles[(row, col + 1)][2]['left'], offsets[(row, col + 1)])
+        if (row + 1, col) in tiles: # bottom neighbour
+            pairs += _border_pairs(borders['bottom'], off, tiles[(row + 1, col)][2]['top'], offsets[(row + 1, col)])
+        # Diagonal neighbours only touch at their corner pixels
+        if (row + 1, col + 1) in tiles:
+            pairs += _border_pairs(borders['bottom'][-1:], off,
+                                   tiles[(row + 1, col + 1)][2]['top'][:1], offsets[(row + 1, col + 1)])
+        if (row + 1, col - 1) in tiles:
+            pairs += _border_pairs(borders['bottom'][:1], off,
+                                   tiles[(row + 1, col - 1)][2]['top'][-1:], offsets[(row + 1, col - 1)])
+
+    parent = list(range(total))
+    if pairs:
+        for a, b in np.unique(np.concatenate(pairs), axis=0).tolist():
+            ra, rb = _find(parent, a), _find(parent, b)
+            if ra != rb:
+                parent[rb] = ra
+    roots = np.array([_find(parent, i) for i in range(total)])
+    _, merged = np.unique(roots, return_inverse=True)
+    n = merged.max() + 1
+
+    stats = np.concatenate([tiles[key][0] for key in sorted(tiles)])
+    centroids = np.concatenate([tiles[key][1] for key in sorted(tiles)])
+    area = np.bincount(merged, weights=stats[:, cv2.CC_STAT_AREA], minlength=n)
+    left = np.full(n, np.iinfo(np.int64).max)
+    top = np.full(n, np.iinfo(np.int64).max)
+    right = np.zeros(n, np.int64)
+    bottom = np.zeros(n, np.int64)
+    np.minimum.at(left, merged, stats[:, cv2.CC_STAT_LEFT])
+    np.minimum.at(top, merged, stats[:, cv2.CC_STAT_TOP])
+    np.maximum.at(right, merged, stats[:, cv2.CC_STAT_LEFT] + stats[:, cv2.CC_STAT_WIDTH])
+    np.maximum.at(bottom, merged, stats[:, cv2.CC_STAT_TOP] + stats[:, cv2.CC_STAT_HEIGHT])
+    cx = np.bincount(merged, weights=centroids[:, 0] * stats[:, cv2.CC_STAT_AREA], minlength=n) / area
+    cy = np.bincount(merged, weights=centroids[:, 1] * stats[:, cv2.CC_STAT_AREA], minlength=n) / area
+
+    keep = np.flatnonzero(area > min_area)
+    blobs = np.empty(len(keep), DETECTION_DTYPE)
+    blobs['label'] = keep + 1
+    blobs['bbox'] = np.stack([left[keep], top[keep], right[keep] - left[keep], bottom[keep] - top[keep]], axis=1)
+    blobs['area'] = area[keep]
+    blobs['centroid'] = np.stack([cx[keep], cy[keep]], axis=1)
+    blobs['fruit'] = fruit_id
+    return blobs
+
+def detect_tiled(img, target_fruit="All Fruits", min_area=FRUIT_MIN_AREA, tile_size=1024, overlap=64,
+                 enhance=True, workers=None):
+    """Detect fruits in a large image (array or memmap) tile by tile.
+
+    With enhance=True every tile is contrast-enhanced with CLAHE computed over
+    the tile plus `overlap` pixels on each side. Returns a DETECTION_DTYPE array
+    in full-image coordinates; with enhance=False it matches
+    fruit_detector.detect_label_blobs(label_fruits(img)).
+    """
+    h, w = img.shape[:2]
+    rows, cols = -(-h // tile_size), -(-w // tile_size)
+    fruit_ids = [i for i, fruit in enumerate(FRUIT_TYPES)
+                 if target_fruit == "All Fruits" or target_fruit.lower() == fruit]
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {}
+        for row in range(rows):
+            for col in range(cols):
+                y0, x0 = row * tile_size, col * tile_size
+                futures[(row, col)] = pool.submit(_process_tile, img, y0, min(h, y0 + tile_size),
+                                                  x0, min(w, x0 + tile_size), overlap if enhance else 0,
+                                                  fruit_ids, enhance)
+        results = {key: future.result() for key, future in futures.items()}
+
+    blobs = [stitch_tiles({key: result[fruit_id] for key, result in results.items()}, fruit_id, min_area)
+             for fruit_id in fruit_ids]
+    return np.concatenate(blobs) if blobs else np.empty(0, DETECTION_DTYPE)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detect fruits in a very large image, tile by tile.")
+    parser.add_argument("image", help="Image file, .npy array or raw BGR dump (with --raw-shape)")
+    parser.add_argument("--raw-shape", help="HEIGHTxWIDTH of a raw BGR uint8 dump")
+    parser.add_argument("--fruit", default="All Fruits", choices=["All Fruits"] + [fruit.capitalize() for fruit in FRUIT_TYPES])
+    parser.add_argument("--min-area", type=int, default=FRUIT_MIN_AREA)
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--overlap", type=int, default=64, help="CLAHE context margin around each tile")
+    parser.add_argument("--no-enhance", dest="enhance", action="store_false", help="Skip CLAHE")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    raw_shape = tuple(int(v) for v in args.raw_shape.lower().split("x")) if args.raw_shape else None
+    img = open_large_image(args.image, raw_shape)
+    detections = detect_tiled(img, args.fruit, args.min_area, args.tile_size, args.overlap,
+                              args.enhance, args.workers)
+    print(json.dumps({"path": args.image, "height": img.shape[0], "width": img.shape[1],
+                      "fruits": detections_to_dicts(detections)}))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,341 @@
+"""Fruit detection on video files and capture devices.
+
+Decoding, detection and rendering run in separate stages connected by
+bounded queues. Detection only re-segments the tiles of a frame whose
+content changed since they were last segmented and reuses the previous
+detections when nothing changed.
+
+Example:
+    python stream.py belt.mp4 --output annotated.mp4 --json detections.jsonl
+    python stream.py 0 --display            # capture device 0, drops frames when behind
+"""
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from smartfruit import profiling
+from smartfruit.image_processor import label_fruits
+from smartfruit.fruit_detector import FRUIT_MIN_AREA, FRUIT_TYPES, detect_label_blobs, detections_to_dicts, draw_fruits
+
+class IncrementalDetector:
+    """Detects fruits in consecutive frames, re-segmenting only changed tiles.
+
+    Every frame is compared with the last segmented content on a grid of
+    tile_size x tile_size tiles using a colour thumbnail, downscaled by
+    thumb_scale. A thumbnail pixel has changed when any of its B, G or R
+    values differs by more than threshold, so hue changes of equal brightness
+    count too. Tiles with at least min_pixels changed thumbnail pixels,
+    counting the pixels next to a change as changed so that fruit edges
+    which only just cross into a tile are caught, are labeled again; the
+    other tiles keep their labels. Detections are recomputed from the label
+    map only when at least one tile changed. Every keyframe_interval frames
+    the whole frame is segmented to bound accumulated drift.
+    """
+
+    def __init__(self, target_fruit="All Fruits", min_area=FRUIT_MIN_AREA, tile_size=64,
+                 threshold=8.0, min_pixels=1, keyframe_interval=300, thumb_scale=4):
+        if tile_size % thumb_scale:
+            raise ValueError("tile_size must be a multiple of thumb_scale")
+        self.target_fruit = target_fruit
+        self.min_area = min_area
+        self.tile_size = tile_size
+        self.threshold = threshold
+        self.min_pixels = min_pixels
+        self.keyframe_interval = keyframe_interval
+        self.thumb_scale = thumb_scale
+        self.reset()
+
+    def reset(self):
+        self.labels = None
+        self.reference = None
+        self.detections = None
+        self.frames = 0
+        self.tiles_total = 0
+        self.tiles_segmented = 0
+
+    def _thumbnail(self, frame):
+        h, w = frame.shape[:2]
+        s = self.thumb_scale
+        h0, w0 = h - h % s, w - w % s
+        thumb = np.empty((-(-h // s), -(-w // s), 3), np.uint8)
+        with profiling.stage("stream.thumbnail"):
+            # Average whole s x s blocks, so that thumbnail pixel (y, x) covers exactly
+            # frame pixels (y*s..y*s+s, x*s..x*s+s) and lines up with the tile grid
+            if h0 and w0:
+                thumb[:h0 // s, :w0 // s] = cv2.resize(frame[:h0, :w0], (w0 // s, h0 // s),
+                                                       interpolation=cv2.INTER_AREA)
+            # The last row and column of the thumbnail average the remaining partial blocks
+            if h0 < h and w0:
+                thumb[-1:, :w0 // s] = cv2.resize(frame[h0:, :w0], (w0 // s, 1), interpolation=cv2.INTER_AREA)
+            if w0 < w and h0:
+                thumb[:h0 // s, -1:] = cv2.resize(frame[:h0, w0:], (1, h0 // s), interpolation=cv2.INTER_AREA)
+            if h0 < h and w0 < w:
+                thumb[-1, -1] = frame[h0:, w0:].reshape(-1, 3).mean(axis=0)
+        return thumb
+
+    def changed_tiles(self, thumb):
+        """Boolean (rows, cols) grid of tiles that differ from the reference thumbnail."""
+        h, w = self.labels.shape
+        rows, cols = -(-h // self.tile_size), -(-w // self.tile_size)
+        cell = self.tile_size // self.thumb_scale # Thumbnail pixels per tile side
+        with profiling.stage("stream.diff"):
+            # Largest change of any colour channel per thumbnail pixel
+            b, g, r = cv2.split(cv2.absdiff(thumb, self.reference))
+            _, moved = cv2.threshold(cv2.max(cv2.max(b, g), r), self.threshold, 1, cv2.THRESH_BINARY)
+            # A fruit edge that barely crosses into a tile hardly changes its pixels there,
+            # but the pixel across the tile border changes fully
+            moved = cv2.dilate(moved, np.ones((3, 3), np.uint8))
+            th, tw = moved.shape
+            # Pad to whole cell x cell blocks, so block (row, col) is exactly the
+            # tile update() re-labels, and count the changed pixels per block
+            padded = np.zeros((rows * cell, cols * cell), np.uint16)
+            padded[:th, :tw] = moved
+            return padded.reshape(rows, cell, cols, cell).sum(axis=(1, 3)) >= self.min_pixels
+
+    def update(self, frame):
+        """Return (detections, fraction of tiles re-segmented) for the next frame."""
+        h, w = frame.shape[:2]
+        thumb = self._thumbnail(frame)
+        keyframe = (self.labels is None or self.labels.shape != (h, w)
+                    or self.frames % self.keyframe_interval == 0)
+        self.frames += 1
+
+        if keyframe:
+            self.labels = label_fruits(frame)
+            self.reference = thumb
+            changed = np.ones((-(-h // self.tile_size), -(-w // self.tile_size)), bool)
+        else:
+            changed = self.changed_tiles(thumb)
+            ts, s = self.tile_size, self.thumb_scale
+            for row, col_start, col_end in _row_runs(changed):
+                # Label each horizontal run of changed tiles in one call
+                y0, y1 = row * ts, min(h, (row + 1) * ts)
+                x0, x1 = col_start * ts, min(w, col_end * ts)
+                label_fruits(frame[y0:y1, x0:x1], out=self.labels[y0:y1, x0:x1])
+                ty0, ty1, tx0, tx1 = y0 // s, -(-y1 // s), x0 // s, -(-x1 // s)
+                self.reference[ty0:ty1, tx0:tx1] = thumb[ty0:ty1, tx0:tx1]
+
+        n_changed = int(np.count_nonzero(changed))
+        self.tiles_total += changed.size
+        self.tiles_segmented += n_changed
+        profiling.count("tiles_resegmented", n_changed)
+        if n_changed or self.detections is None:
+            self.detections = detect_label_blobs(self.labels, self.target_fruit, self.min_area)
+        return self.detections, n_changed / changed.size
+
+def _row_runs(changed):
+    """Yield (row, first column, end column) of every horizontal run of True tiles."""
+    for row in np.flatnonzero(changed.any(axis=1)):
+        padded = np.concatenate(([False], changed[row], [False]))
+        edges = np.flatnonzero(padded[1:] != padded[:-1])
+        for start, end in zip(edges[::2], edges[1::2]):
+            yield int(row), int(start), int(end)
+
+def open_capture(source):
+    """Open a capture device (integer index) or a video file."""
+    device = isinstance(source, int) or (isinstance(source, str) and source.isdigit())
+    cap = cv2.VideoCapture(int(source) if device else source)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video source {source!r}")
+    return cap, device
+
+def _put_latest(q, item):
+    """Put item, dropping the oldest queued item when the queue is full. Returns True if one was dropped."""
+    try:
+        q.put_nowait(item)
+        return False
+    except queue.Full:
+        try:
+            q.get_nowait()
+        except queue.Empty:
+            pass
+        q.put_nowait(item)
+        return True
+
+def run_stream(source, detector=None, on_result=None, queue_size=4, drop_frames=None, realtime=False,
+               max_frames=None):
+    """Run decode -> detect -> on_result over a video source (path, device index or opened VideoCapture).
+
+    Decoding and detection run in background threads; on_result(index, frame,
+    detections) is called in the calling thread, so it may draw or display.
+    With drop_frames (default: on for capture devices) the decoder never
+    waits for detection: when the queue is full the oldest frame is skipped.
+    realtime paces file decoding to the file frame rate, as a camera would.
+    Returns a dict of throughput statistics.
+    """
+    if isinstance(source, cv2.VideoCapture):
+        cap, device = source, False
+    else:
+        cap, device = open_capture(source)
+    detector = detector or IncrementalDetector()
+    if drop_frames is None:
+        drop_frames = device
+    frame_interval = 0.0
+    if realtime and not device:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_interval = 1.0 / fps if fps and fps > 0 else 0.0
+
+    frames_in = queue.Queue(queue_size)
+    results = queue.Queue(queue_size)
+    stop = threading.Event()
+    stats = {"decoded": 0, "dropped": 0, "processed": 0}
+
+    def decode():
+        next_time = time.perf_counter()
+        try:
+            index = 0
+            while not stop.is_set() and (max_frames is None or index < max_frames):
+                with profiling.stage("decode"):
+                    ok, frame = cap.read()
+                if not ok:
+                    break
+                if frame_interval:
+                    next_time += frame_interval
+                    delay = next_time - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                stats["decoded"] += 1
+                if drop_frames:
+                    stats["dropped"] += _put_latest(frames_in, (index, frame))
+                else:
+                    while not stop.is_set():
+                        try:
+                            frames_in.put((index, frame), timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+                index += 1
+        finally:
+            cap.release()
+            # End-of-stream marker; only displace a frame if the detector is being stopped anyway
+            while True:
+                try:
+                    frames_in.put(None, timeout=0.1)
+                    break
+                except queue.Full:
+                    if stop.is_set():
+                        _put_latest(frames_in, None)
+                        break
+
+    def detect():
+        try:
+            while True:
+                item = frames_in.get()
+                if item is None or stop.is_set():
+                    break
+                index, frame = item
+                with profiling.frame(index):
+                    detections, changed = detector.update(frame)
+                results.put((index, frame, detections, changed))
+        finally:
+            results.put(None)
+
+    threads = [threading.Thread(target=decode, daemon=True), threading.Thread(target=detect, daemon=True)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    try:
+        while True:
+            item = results.get()
+            if item is None:
+                break
+            index, frame, detections, changed = item
+            stats["processed"] += 1
+            if on_result is not None and on_result(index, frame, detections, changed) is False:
+                break
+    finally:
+        stop.set()
+        # Unblock the detector if it is waiting for a full results queue
+        while any(t.is_alive() for t in threads):
+            try:
+                results.get(timeout=0.05)
+            except queue.Empty:
+                pass
+        for t in threads:
+            t.join()
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = round(elapsed, 3)
+    stats["fps"] = round(stats["processed"] / elapsed, 2) if elapsed > 0 else 0.0
+    stats["tiles_resegmented"] = round(detector.tiles_segmented / detector.tiles_total, 4) if detector.tiles_total else 0.0
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detect fruits in a video file or camera stream.")
+    parser.add_argument("source", help="Video file path or capture device index")
+    parser.add_argument("--fruit", default="All Fruits", choices=["All Fruits"] + [fruit.capitalize() for fruit in FRUIT_TYPES])
+    parser.add_argument("--output", help="Write the annotated video to this file")
+    parser.add_argument("--json", help="Write one JSON line of detections per processed frame")
+    parser.add_argument("--display", action="store_true", help="Show the annotated stream in a window")
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument("--tile-size", type=int, default=64)
+    parser.add_argument("--threshold", type=float, default=8.0,
+                        help="Colour change (0-255, any channel) of a thumbnail pixel that marks its tile as changed")
+    parser.add_argument("--drop", dest="drop_frames", action="store_true", default=None,
+                        help="Skip frames when detection falls behind (default for devices)")
+    parser.add_argument("--no-drop", dest="drop_frames", action="store_false", help="Process every frame")
+    parser.add_argument("--realtime", action="store_true", help="Pace video files at their frame rate")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--metrics-out", metavar="PREFIX",
+                        help="Write stage metrics to PREFIX.prom (Prometheus) and PREFIX.json")
+    parser.add_argument("--trace-out", help="Write stage traces of the slowest frames to this JSON file")
+    args = parser.parse_args(argv)
+    if args.metrics_out or args.trace_out:
+        profiling.enable()
+
+    writer = None
+    json_out = open(args.json, "w", encoding="utf-8") if args.json else None
+
+    def render(index, frame, detections, changed):
+        nonlocal writer
+        if json_out:
+            json_out.write(json.dumps({"frame": index, "changed_tiles": round(changed, 4),
+                                       "fruits": [{"fruit_type": d["fruit_type"], "bbox": list(d["bbox"]),
+                                                   "area": d["mask_area"]}
+                                                  for d in detections_to_dicts(detections)]}) + "\n")
+        if args.output or args.display:
+            draw_fruits(frame, detections)
+        if args.output:
+            if writer is None:
+                h, w = frame.shape[:2]
+                writer = cv2.VideoWriter(args.output, cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+            writer.write(frame)
+        if args.display:
+            cv2.imshow("SmartFruit Stream", frame)
+            if cv2.waitKey(1) & 0xFF in (27, ord("q")):
+                return False
+
+    cap, device = open_capture(args.source)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    drop_frames = device if args.drop_frames is None else args.drop_frames
+    detector = IncrementalDetector(args.fruit, tile_size=args.tile_size, threshold=args.threshold)
+    try:
+        stats = run_stream(cap, detector, render, args.queue_size, drop_frames,
+                           args.realtime, args.max_frames)
+    finally:
+        if writer is not None:
+            writer.release()
+        if json_out:
+            json_out.close()
+        if args.display:
+            cv2.destroyAllWindows()
+    print(f"Decoded {stats['decoded']} frames, processed {stats['processed']}, dropped {stats['dropped']} "
+          f"in {stats['seconds']:.2f}s -> {stats['fps']:.2f} fps, "
+          f"{stats['tiles_resegmented']:.1%} of tiles re-segmented", file=sys.stderr)
+    if args.metrics_out:
+        with open(args.metrics_out + ".prom", "w", encoding="utf-8") as f:
+            f.write(profiling.export_prometheus())
+        with open(args.metrics_out + ".json", "w", encoding="utf-8") as f:
+            f.write(profiling.snapshot_json())
+    if args.trace_out:
+        profiling.dump_traces(args.trace_out)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
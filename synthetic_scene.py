@@ -0,0 +1,102 @@
+"""Deterministic synthetic fruit scenes with known ground truth, for benchmarks."""
+import cv2
+import numpy as np
+
+# Standard benchmark resolutions (width, height)
+RESOLUTIONS = {
+    "vga": (640, 480),
+    "hd": (1280, 720),
+    "fullhd": (1920, 1080),
+    "4k": (3840, 2160),
+    "8k": (7680, 4320),
+}
+
+# HSV colors (OpenCV scale) of the generated fruits. Each one falls inside the
+# HSV range of its own fruit only, so the ground truth is unambiguous.
+SCENE_FRUIT_COLORS = {
+    "apple": [(0, 210, 200), (175, 200, 190), (75, 180, 170)], # red, dark red, green apple
+    "orange": [(12, 220, 235)],
+    "banana": [(28, 200, 220), (45, 170, 180), (24, 120, 150)], # yellow, green, ripe
+}
+
+def _hsv_to_bgr(hsv):
+    return tuple(int(c) for c in cv2.cvtColor(np.uint8([[hsv]]), cv2.COLOR_HSV2BGR)[0, 0])
+
+def _draw_fruit(canvas, fruit, rng, cell_w, cell_h):
+    """Draw one fruit shape centered in a cell-sized mask canvas."""
+    cx, cy = cell_w // 2, cell_h // 2
+    size = min(cell_w, cell_h)
+    if fruit == "banana":
+        # Thick arc of an ellipse, rotated randomly
+        axes = (int(size * rng.uniform(0.30, 0.40)), int(size * rng.uniform(0.18, 0.26)))
+        thickness = max(3, int(size * rng.uniform(0.08, 0.12)))
+        angle = float(rng.uniform(0, 360))
+        cv2.ellipse(canvas, (cx, cy), axes, angle, 20, 160, 255, thickness)
+    else:
+        radius = size * rng.uniform(0.22, 0.34)
+        axes = (int(radius), int(radius * rng.uniform(0.85, 1.0)))
+        cv2.ellipse(canvas, (cx, cy), axes, float(rng.uniform(0, 180)), 0, 360, 255, -1)
+
+def generate_scene(width, height, counts=None, seed=0, noise=4):
+    """Generate a BGR belt image with fruits at known positions.
+
+    counts maps fruit type to the number of fruits to draw (default: a few of
+    each, scaled with the image area). Fruits are placed in distinct cells of
+    a grid so they never touch. Returns (img, truth) where truth is a list of
+    {'fruit': type, 'bbox': (x, y, w, h)} dicts.
+    """
+    rng = np.random.default_rng(seed)
+    if counts is None:
+        per_fruit = max(2, int(round(width * height / (640 * 480))))
+        counts = {fruit: per_fruit for fruit in SCENE_FRUIT_COLORS}
+
+    fruits = [fruit for fruit, n in counts.items() for _ in range(n)]
+    cols = int(np.ceil(np.sqrt(len(fruits) * width / height))) if fruits else 1
+    rows = int(np.ceil(len(fruits) / cols)) if fruits else 1
+    cell_w, cell_h = width // cols, height // rows
+
+    # Low-saturation gray belt background, outside every fruit HSV range
+    img = np.empty((height, width, 3), np.uint8)
+    img[:] = (70, 72, 68)
+    if noise:
+        img[:] = np.clip(img.astype(np.int16) + rng.integers(-noise, noise + 1, (height, width, 1), dtype=np.int16),
+                         0, 255).astype(np.uint8)
+
+    truth = []
+    cells = rng.permutation(rows * cols)[:len(fruits)]
+    canvas = np.zeros((cell_h, cell_w), np.uint8)
+    for fruit, cell in zip(fruits, cells):
+        canvas[:] = 0
+        _draw_fruit(canvas, fruit, rng, cell_w, cell_h)
+        colors = SCENE_FRUIT_COLORS[fruit]
+        color = _hsv_to_bgr(colors[rng.integers(len(colors))])
+
+        x0, y0 = int(cell % cols) * cell_w, int(cell // cols) * cell_h
+        img[y0:y0 + cell_h, x0:x0 + cell_w][canvas != 0] = color
+        x, y, w, h = cv2.boundingRect(canvas)
+        truth.append({"fruit": fruit, "bbox": (x0 + x, y0 + y, w, h)})
+
+    return img, truth
+
+# Moving fruits of generate_clip(): (BGR color, radius, start (x, y), step (dx, dy) per frame)
+# as fractions of the frame width and height. The red apple has nearly the gray
+# level of the belt, the orange runs half off the bottom edge.
+CLIP_FRUITS = [
+    ((0, 0, 230), 0.06, (0.1, 0.3), (0.0625, 0.0)),
+    (_hsv_to_bgr((28, 200, 220)), 0.05, (0.9, 0.6), (-0.05, 0.01)),
+    (_hsv_to_bgr((12, 220, 235)), 0.04, (0.0, 1.0), (0.04, 0.0)),
+]
+
+def generate_clip(width, height, frames=40, seed=0, noise=4):
+    """Yield BGR frames of fruits moving over the belt, a few pixels further in each frame."""
+    rng = np.random.default_rng(seed)
+    belt, _ = generate_scene(width, height, counts={}, seed=seed, noise=noise)
+    for i in range(frames):
+        frame = belt.copy()
+        for color, radius, (x, y), (dx, dy) in CLIP_FRUITS:
+            center = (int(round((x + dx * i) * width)), int(round((y + dy * i) * height)))
+            cv2.circle(frame, center, int(radius * min(width, height)), color, -1)
+        if noise:
+            frame = np.clip(frame.astype(np.int16) + rng.integers(-noise, noise + 1, frame.shape[:2] + (1,),
+                                                                  dtype=np.int16), 0, 255).astype(np.uint8)
+        yield frame